@@ -1,8 +1,28 @@
-from flask import Blueprint, jsonify, request, send_file
-from ..training.trainer import trainer_instance
+from flask import Blueprint, Response, jsonify, request, send_file
+from flask_socketio import join_room
+from eventlet import tpool
+from ..training.sessions import registry, AdmissionError
+from ..training.scheduler import scheduler
+from ..utils.heatmap import parse_view
+from ..utils.image_processing import load_batch_images, CENTERINGS
+from ..utils.weight_codec import FORMATS as WEIGHT_FORMATS, MIMETYPE as WEIGHT_MIMETYPE
 
 api = Blueprint('api', __name__)
 
+def _model_id():
+    """
+    The session a request refers to: 'model_id' from the query string, JSON body or form.
+    Requests without one use the default session.
+    """
+    body = request.get_json(silent=True) or {}
+    return request.args.get('model_id') or body.get('model_id') or request.form.get('model_id')
+
+def _unknown_model():
+    if not _model_id():
+        # The default session is only created when there is room, see SessionRegistry.get
+        return jsonify({"error": "Server full: create a session or send a model_id"}), 503
+    return jsonify({"error": f"Unknown model_id '{_model_id()}'"}), 404
+
 @api.route('/datasets', methods=['GET'])
 def get_datasets():
     """
@@ -14,12 +34,15 @@ def get_datasets():
 @api.route('/create-model', methods=['POST'])
 def create_model():
     """
-    Initializes a new model configuration.
-    Currently a placeholder as the training loop handles initialization dynamically,
-    but useful for future expansion (e.g., verifying architecture before starting).
+    Creates a new training session and returns its model_id.
+    The model itself is built when training starts; pass the model_id to every other
+    endpoint (and socket event) to work with this session.
     """
-    data = request.json
-    return jsonify({"model_id": "model_1", "status": "ready"})
+    try:
+        model_id, _ = registry.create()
+    except AdmissionError as e:
+        return jsonify({"status": "rejected", "error": str(e)}), e.status
+    return jsonify({"model_id": model_id, "status": "ready"})
 
 @api.route('/start-training', methods=['POST'])
 def start_training():
@@ -27,30 +50,117 @@ def start_training():
     Starts the training process.
     Receives configuration (dataset, architecture, hyperparameters) from the frontend
     and triggers the background training thread.
+    When the server is already running as many trainings as it has room for, the run is
+    queued instead (202) and starts automatically once a slot frees up.
+    If the body contains the caller's Socket.IO id ('sid'), that client is joined to the
+    session's room so it receives the training events without a separate 'join_session'.
     """
-    data = request.json
-    if not trainer_instance.is_running:
-        trainer_instance.start(data)
-        return jsonify({"status": "started"})
-    return jsonify({"status": "already_running"}), 400
+    data = request.json or {}
+    trainer = registry.get(_model_id())
+    if trainer is None:
+        return _unknown_model()
+    if data.get('sid'):
+        # Join first, so the client also gets the setup logs emitted while starting
+        join_room(trainer.room, sid=data['sid'], namespace='/')
+    try:
+        job = scheduler.submit(trainer.session_id, data)
+    except ValueError as e:
+        return jsonify({"status": str(e), "error": str(e)}), 400
+
+    info = scheduler.describe(job)
+    if job.status == 'failed':
+        return jsonify({"status": "failed", "error": job.error, **info}), 500
+    if job.status == 'queued':
+        return jsonify(info), 202
+    return jsonify({**info, "status": "started"})
 
 @api.route('/stop-training', methods=['POST'])
 def stop_training():
     """
     Stops the currently running training session.
     It sets a flag that the training loop checks to exit gracefully.
+    A session that is still waiting in the queue is simply removed from it.
     """
-    trainer_instance.stop()
+    trainer = registry.get(_model_id())
+    if trainer is None:
+        return _unknown_model()
+    job = scheduler.job_for(trainer.session_id)
+    if job is not None and job.status == 'queued':
+        scheduler.cancel(job.job_id)
+    trainer.stop()
     return jsonify({"status": "stopped"})
 
+@api.route('/jobs', methods=['GET'])
+def list_jobs():
+    """Returns the training queue: running jobs and queued jobs with their position and ETA."""
+    return jsonify(scheduler.snapshot())
+
+@api.route('/jobs/<job_id>', methods=['GET', 'DELETE'])
+def job_status(job_id):
+    """
+    GET: status, queue position and ETA (seconds) of one job.
+    DELETE: removes a queued job from the queue.
+    """
+    job = scheduler.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job '{job_id}'"}), 404
+    if request.method == 'DELETE' and not scheduler.cancel(job_id):
+        return jsonify({"error": "Only queued jobs can be cancelled"}), 409
+    return jsonify(scheduler.describe(job))
+
 @api.route('/weights', methods=['GET'])
 def get_weights():
     """
     Fetches the raw weights of a specific layer (or all layers).
     Used by the HeatmapViewer to visualize the internal state of the network.
+
+    The response format is negotiated:
+    - ?format=f16 or ?format=u8 returns a compact binary snapshot (see utils/weight_codec.py).
+    - An 'Accept: application/octet-stream' header without ?format defaults to f16.
+    - Otherwise JSON, as before.
+    ?compress=1 additionally deflates the binary body.
+
+    Large layers can be reduced on the server (see utils/heatmap.py):
+    ?max_rows=&max_cols= pool to a target resolution, ?reduce=mean|absmax picks the pooling,
+    ?rows=start:stop&cols=start:stop zoom into a region first.
+
+    Responses carry an ETag tied to the trainer's optimizer step, so polling with
+    If-None-Match costs a 304 while the weights are unchanged (e.g. training paused or stopped).
     """
+    trainer = registry.get(_model_id())
+    if trainer is None:
+        return _unknown_model()
     layer = request.args.get('layer')
-    return jsonify(trainer_instance.get_weights(layer))
+    try:
+        view = parse_view(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    fmt = request.args.get('format')
+    if fmt is None and request.accept_mimetypes.best == WEIGHT_MIMETYPE:
+        fmt = 'f16'
+    fmt = fmt or 'json'
+    if fmt != 'json' and fmt not in WEIGHT_FORMATS:
+        return jsonify({"error": f"Unknown format '{fmt}'"}), 400
+    compress = fmt != 'json' and request.args.get('compress', '0').lower() in ('1', 'true', 'yes')
+
+    # Conditional GET: if the client already has this weight version, skip serialization entirely
+    etag = trainer.weights_etag(layer, fmt, compress, view)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        try:
+            etag, body = trainer.get_weights_snapshot(layer, fmt, compress, view)
+        except ValueError as e:
+            # e.g. a zoom range outside the layer
+            return jsonify({"error": str(e)}), 400
+        response = Response(body, mimetype='application/json' if fmt == 'json' else WEIGHT_MIMETYPE)
+        if compress:
+            # zlib streams are what HTTP calls 'deflate', so browsers inflate them transparently
+            response.headers['Content-Encoding'] = 'deflate'
+    response.set_etag(etag)
+    # Let browsers cache the body, but revalidate on every poll
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @api.route('/upload-image', methods=['POST'])
 def upload_image():
@@ -64,17 +174,67 @@ def upload_image():
     if 'image' not in request.files:
         return jsonify({"error": "No image provided"}), 400
     
+    trainer = registry.get(_model_id())
+    if trainer is None:
+        return _unknown_model()
     file = request.files['image']
-    result = trainer_instance.predict(file)
+    result = trainer.predict(file)
     return jsonify(result)
 
+@api.route('/predict-batch', methods=['POST'])
+def predict_batch():
+    """
+    Classifies many images in one request: any number of 'images' files, each an image,
+    a .zip of images or a .npz of grayscale arrays (see load_batch_images).
+    All of them go through the same inference snapshot, in batched forward passes.
+    Optional form field 'centering': 'box' (default, like /upload-image) or 'mass' (like MNIST).
+    """
+    files = request.files.getlist('images') + request.files.getlist('archive')
+    if not files:
+        return jsonify({"error": "No images provided"}), 400
+
+    trainer = registry.get(_model_id())
+    if trainer is None:
+        return _unknown_model()
+    if trainer.model is None:
+        return jsonify({"error": "No model yet, start a training first"}), 409
+    centering = request.form.get('centering', 'box')
+    if centering not in CENTERINGS:
+        return jsonify({"error": f"Unknown centering '{centering}', expected one of {list(CENTERINGS)}"}), 400
+    try:
+        # Decoding hundreds of images is CPU work: keep it off the hub
+        images = tpool.execute(load_batch_images, files)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    predictions, snapshot_step = trainer.predict_batch(images, centering)
+    return jsonify({"predictions": predictions, "count": len(predictions), "snapshot_step": snapshot_step})
+
+@api.route('/inference-snapshot', methods=['POST'])
+def inference_snapshot():
+    """
+    Refreshes the frozen copy of the model that /upload-image predicts with.
+    While training it is taken after the current step (202), otherwise right away (200).
+    """
+    trainer = registry.get(_model_id())
+    if trainer is None:
+        return _unknown_model()
+    if trainer.model is None:
+        return jsonify({"error": "No model yet, start a training first"}), 409
+    snapshot = trainer.request_inference_snapshot()
+    if snapshot is None:
+        return jsonify({"status": "requested"}), 202
+    return jsonify({"status": "published", "step": snapshot.version[1], "fused": snapshot.fused})
+
 @api.route('/export-model', methods=['GET'])
 def export_model():
     """
     Exports the trained model as a .pth file.
     Allows the user to download their work.
     """
-    path = trainer_instance.save_model()
+    trainer = registry.get(_model_id())
+    if trainer is None:
+        return _unknown_model()
+    path = trainer.save_model()
     if path:
         return send_file(path, as_attachment=True, download_name='model.pth')
     return jsonify({"error": "No model to export"}), 404
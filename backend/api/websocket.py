@@ -1,12 +1,18 @@
-from flask_socketio import emit
+from flask import request
+from flask_socketio import emit, join_room, leave_room
 from backend.extensions import socketio
+from backend.training import weight_stream
+from backend.training.scheduler import scheduler
+from backend.training.sessions import registry
+from backend.utils.heatmap import parse_view
 
 """
 WebSocket Event Handlers
 ------------------------
 Handles the real-time bidirectional communication between Frontend and Backend.
-Used primarily for connection status verification.
-Note: Training metrics are emitted directly from trainer.py, not here.
+Used for connection status verification, session rooms and weight stream subscriptions.
+Note: Training metrics are emitted directly from trainer.py, not here. They go to the room
+of their session only, so a client has to 'join_session' to receive them.
 """
 
 @socketio.on('connect')
@@ -18,4 +24,61 @@ def handle_connect():
 @socketio.on('disconnect')
 def handle_disconnect():
     """Triggered when the client connection is lost or closed."""
+    weight_stream.unsubscribe(request.sid)
     print('Client disconnected')
+
+@socketio.on('join_session')
+def handle_join_session(data):
+    """Subscribes this client to the training events (log, training_update, ...) of a session."""
+    data = data or {}
+    trainer = registry.get(data.get('model_id'))
+    if trainer is None:
+        emit('session_error', {'error': f"Unknown model_id '{data.get('model_id')}'"})
+        return
+    join_room(trainer.room)
+    emit('session_joined', {'model_id': trainer.session_id})
+    job = scheduler.job_for(trainer.session_id)
+    if job is not None:
+        emit('queue_update', scheduler.describe(job))
+
+@socketio.on('leave_session')
+def handle_leave_session(data):
+    """Stops receiving the training events of a session."""
+    data = data or {}
+    trainer = registry.get(data.get('model_id'))
+    if trainer is not None:
+        leave_room(trainer.room)
+
+@socketio.on('subscribe_weights')
+def handle_subscribe_weights(data):
+    """
+    Starts pushing 'weights_frame' events for one layer to this client.
+    Payload: {model_id, layer, rate (frames/s, capped)} plus the optional heatmap view arguments
+    of /api/weights (max_rows, max_cols, reduce, rows, cols).
+    """
+    data = data or {}
+    trainer = registry.get(data.get('model_id'))
+    if trainer is None:
+        emit('weights_error', {'error': f"Unknown model_id '{data.get('model_id')}'"})
+        return
+    if not data.get('layer'):
+        emit('weights_error', {'error': "Missing 'layer'"})
+        return
+    try:
+        view = parse_view(data)
+    except ValueError as e:
+        emit('weights_error', {'error': str(e)})
+        return
+    rate = data.get('rate', weight_stream.DEFAULT_STREAM_HZ)
+    weight_stream.subscribe(request.sid, trainer, data['layer'], rate, view)
+
+@socketio.on('unsubscribe_weights')
+def handle_unsubscribe_weights(data=None):
+    """Stops the weight stream of this client."""
+    weight_stream.unsubscribe(request.sid)
+
+@socketio.on('ack_weights')
+def handle_ack_weights(data):
+    """The client applied frame {seq}; later frames may be sent as deltas against it."""
+    if data and 'seq' in data:
+        weight_stream.acknowledge(request.sid, data['seq'])
@@ -0,0 +1,6 @@
+"""
+Benchmarks Package
+------------------
+Standalone micro-benchmarks for the hot paths of the backend.
+Run them as modules from the project root, e.g. `python -m backend.benchmarks.telemetry_emit`.
+"""
@@ -0,0 +1,71 @@
+"""
+Micro-benchmark of the memory layouts for the convolutional models.
+
+For LeNet and ResNet18, measures on this host:
+  - training step time (forward + backward + optimizer step) in NCHW and channels_last,
+  - inference time of the eager model vs. the Conv+BN fused copy, in both layouts.
+The numbers tell whether 'memory_format': 'channels_last' and 'fuse_inference' pay off here.
+Fused outputs are checked against the eager model before timing.
+
+Usage: python -m backend.benchmarks.memory_format [batch_size] [steps]
+"""
+import sys
+import time
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from backend.training.architectures import get_architecture
+from backend.training.memory_format import MEMORY_FORMATS, fuse_for_inference, to_memory_format
+
+ARCHITECTURES = ("lenet", "resnet")
+
+def timed(fn, steps, warmup=2):
+    """Average seconds per call of fn() after a few warm-up calls."""
+    for _ in range(warmup):
+        fn()
+    start = time.perf_counter()
+    for _ in range(steps):
+        fn()
+    return (time.perf_counter() - start) / steps
+
+def train_step_time(architecture, memory_format, batch_size, steps):
+    model = get_architecture(architecture).to(memory_format=memory_format)
+    optimizer = optim.Adam(model.parameters(), lr=0.001)
+    criterion = nn.CrossEntropyLoss()
+    data = to_memory_format(torch.randn(batch_size, 1, 28, 28), memory_format)
+    target = torch.randint(0, 10, (batch_size,))
+
+    def step():
+        optimizer.zero_grad()
+        criterion(model(data), target).backward()
+        optimizer.step()
+    return timed(step, steps)
+
+def inference_times(architecture, memory_format, batch_size, steps):
+    """(eager seconds, fused seconds) per forward pass of an eval-mode model."""
+    model = get_architecture(architecture).eval().to(memory_format=memory_format)
+    fused = fuse_for_inference(model, memory_format)
+    data = to_memory_format(torch.randn(batch_size, 1, 28, 28), memory_format)
+    with torch.no_grad():
+        error = (model(data) - fused(data)).abs().max().item()
+        assert error < 1e-3, f"fused {architecture} differs from eager by {error}"
+        return timed(lambda: model(data), steps), timed(lambda: fused(data), steps)
+
+def run(batch_size=64, steps=10):
+    print(f"batch {batch_size}, {steps} steps, {torch.get_num_threads()} threads")
+    results = {}
+    for architecture in ARCHITECTURES:
+        for name, memory_format in MEMORY_FORMATS.items():
+            train = train_step_time(architecture, memory_format, batch_size, steps)
+            eager, fused = inference_times(architecture, memory_format, batch_size, steps)
+            results[architecture, name] = (train, eager, fused)
+            print(f"{architecture:>6} {name:>13}: train {train * 1000:8.2f} ms/step | "
+                  f"infer {eager * 1000:7.2f} ms eager, {fused * 1000:7.2f} ms fused")
+        base = results[architecture, "contiguous"][0]
+        nhwc = results[architecture, "channels_last"][0]
+        print(f"{architecture:>6} channels_last vs contiguous (train): {base / nhwc:.2f}x")
+    return results
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 64,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 10)
@@ -0,0 +1,63 @@
+"""
+Micro-benchmark of the digit preprocessing pipelines.
+
+Draws synthetic digits (random thick strokes, dark on light, at various sizes and positions),
+then compares on this host:
+  - PIL: prepare_digit() + get_transform() per image, then torch.stack (the per-upload path),
+  - NumPy: prepare_digits() + digits_to_tensor() on the whole stack.
+Their agreement (pixels and ink IoU of the 28x28 digits) is printed for reference; the bounds
+are enforced by backend/tests/test_image_processing.py, on the same synthetic_digits()
+(backend/tests/helpers.py).
+
+Usage: python -m backend.benchmarks.preprocessing [images] [canvas_size]
+"""
+import sys
+import time
+import numpy as np
+import torch
+from PIL import Image
+from backend.tests.helpers import synthetic_digits
+from backend.utils.image_processing import prepare_digit, prepare_digits, digits_to_tensor, get_transform
+
+def pil_pipeline(images):
+    transform = get_transform()
+    return torch.stack([transform(prepare_digit(Image.fromarray(image, mode='L'))) for image in images])
+
+def numpy_pipeline(images):
+    return digits_to_tensor(prepare_digits(images))
+
+def compare(images):
+    """(pixel agreement, mean ink IoU) between the digits of both pipelines."""
+    reference = np.stack([np.asarray(prepare_digit(Image.fromarray(image, mode='L'))) for image in images])
+    digits = prepare_digits(images)
+    agreement = (reference == digits).mean()
+    a, b = reference > 0, digits > 0
+    union = (a | b).sum(axis=(1, 2))
+    iou = np.where(union > 0, (a & b).sum(axis=(1, 2)) / np.maximum(union, 1), 1.0)
+    return agreement, iou.mean()
+
+def timed(fn, steps=3):
+    """Best seconds per call of fn() after one warm-up call."""
+    fn()
+    best = float("inf")
+    for _ in range(steps):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def run(count=256, size=280):
+    images = synthetic_digits(count, size)
+    print(f"{count} images of {size}x{size}, {torch.get_num_threads()} threads")
+    agreement, iou = compare(images)
+    print(f"agreement: {agreement * 100:.2f}% of pixels, mean ink IoU {iou:.3f}")
+
+    pil = timed(lambda: pil_pipeline(images))
+    vectorized = timed(lambda: numpy_pipeline(images))
+    print(f"   PIL: {count / pil:9.0f} images/s")
+    print(f" NumPy: {count / vectorized:9.0f} images/s ({pil / vectorized:.2f}x)")
+    return agreement, iou, pil, vectorized
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 256,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 280)
@@ -0,0 +1,49 @@
+"""
+Micro-benchmark of the 'training_update' emit path.
+
+Measures the CPU time spent encoding the sample fields (input image + output probabilities)
+and the resulting Socket.IO wire size, for the 'json' and 'binary' telemetry formats.
+The wire size comes from python-socketio's own packet encoder, i.e. what is actually sent.
+
+Usage: python -m backend.benchmarks.telemetry_emit [iterations]
+"""
+import sys
+import time
+import torch
+from socketio import packet
+from backend.training.telemetry import TELEMETRY_FORMATS, encode_sample_input, encode_sample_output
+
+def build_payload(image, probs, fmt):
+    """The sample part of a training_update, as built by the training loop."""
+    return {
+        "sample_input": encode_sample_input(image, fmt),
+        "sample_output": encode_sample_output(probs, fmt),
+        "format": fmt,
+    }
+
+def wire_size(payload):
+    """Bytes on the wire for one emit: the text packet plus any binary attachments."""
+    encoded = packet.Packet(packet.EVENT, data=['training_update', payload]).encode()
+    if not isinstance(encoded, list):
+        encoded = [encoded]
+    return sum(len(part) for part in encoded)
+
+def run(iterations=2000):
+    image = torch.randn(1, 28, 28)
+    probs = torch.softmax(torch.randn(10), dim=0)
+    results = {}
+    for fmt in TELEMETRY_FORMATS:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            payload = build_payload(image, probs, fmt)
+            size = wire_size(payload)
+        elapsed = time.perf_counter() - start
+        results[fmt] = (elapsed / iterations * 1e6, size)
+        print(f"{fmt:>6}: {results[fmt][0]:8.1f} us/emit, {size:5d} bytes/emit")
+    json_us, json_size = results["json"]
+    bin_us, bin_size = results["binary"]
+    print(f"binary vs json: {json_us / bin_us:.1f}x faster, {json_size / bin_size:.1f}x smaller")
+    return results
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,19 @@
+"""
+Test data shared by the tests and the benchmarks (backend/benchmarks imports it too).
+"""
+import numpy as np
+from PIL import Image, ImageDraw
+
+def synthetic_digits(count, size=280, seed=0):
+    """uint8 array [count, size, size] of random strokes, black ink on white."""
+    rng = np.random.default_rng(seed)
+    images = np.empty((count, size, size), dtype=np.uint8)
+    for i in range(count):
+        img = Image.new('L', (size, size), 255)
+        draw = ImageDraw.Draw(img)
+        scale = rng.uniform(0.1, 0.8) * size
+        origin = rng.uniform(0, size - scale, 2)
+        points = [tuple(origin + rng.uniform(0, scale, 2)) for _ in range(rng.integers(2, 6))]
+        draw.line(points, fill=int(rng.integers(0, 120)), width=max(1, int(scale / 10)))
+        images[i] = np.asarray(img)
+    return images
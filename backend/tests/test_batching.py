@@ -0,0 +1,24 @@
+"""
+Tests for micro-batch splitting and sizing.
+
+Run from the project root: pytest
+"""
+from backend.training.batching import MicroBatcher, AdaptiveBatchSize, MIN_MICRO_BATCH
+
+def test_split_covers_the_batch():
+    assert MicroBatcher(16).split(64) == [16] * 4
+    assert MicroBatcher(16).split(49) == [16, 16, 17]
+    assert MicroBatcher(16).split(40) == [16, 16, 8]
+
+def test_fixed_size_is_raised_to_the_minimum():
+    # micro_batch_size: 1 would hand BatchNorm single samples
+    batcher = MicroBatcher(1)
+    assert batcher.size == MIN_MICRO_BATCH
+    assert min(batcher.split(64)) >= MIN_MICRO_BATCH
+
+def test_adaptive_never_exceeds_the_batch():
+    batcher = AdaptiveBatchSize(4)
+    assert batcher.size <= 4
+    for _ in range(20):
+        batcher.observe(batcher.size, 0.001)
+    assert batcher.size == 4
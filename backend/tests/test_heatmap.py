@@ -0,0 +1,44 @@
+"""
+Tests for the server-side weight views (crop/pool) and the uint8 frame codec.
+
+Run from the project root: pytest
+"""
+import pytest
+import torch
+from backend.utils.heatmap import parse_view, apply_view
+from backend.utils.weight_codec import quantize_uint8
+
+def view(**args):
+    return parse_view(args)
+
+def test_crop_and_pool():
+    matrix = torch.arange(64.0).view(8, 8)
+    x, meta = apply_view(matrix, view(rows="2:6", max_cols=4))
+    assert x.shape == (4, 4)
+    assert meta["rows"] == [2, 6] and meta["cols"] == [0, 8] and meta["source_shape"] == [8, 8]
+
+def test_vector_ignores_rows():
+    x, meta = apply_view(torch.arange(10.0), view(rows="3:5", cols="2:7"))
+    assert x.tolist() == [2.0, 3.0, 4.0, 5.0, 6.0]
+
+@pytest.mark.parametrize("args", [
+    {"rows": "9999:"},
+    {"rows": "5:2"},
+    {"cols": "-1:0"},
+    {"cols": "8:", "max_cols": "4"},
+])
+def test_empty_crop_is_rejected(args):
+    with pytest.raises(ValueError):
+        apply_view(torch.zeros(8, 8), view(**args))
+
+def test_quantize_round_trip():
+    tensor = torch.linspace(-1, 1, 100)
+    q, scale, zero = quantize_uint8(tensor)
+    assert q.dtype == torch.uint8
+    assert torch.allclose(q.float() * scale + zero, tensor, atol=scale)
+
+def test_quantize_constant_and_empty():
+    q, scale, zero = quantize_uint8(torch.full((3, 3), 0.5))
+    assert scale == 1.0 and zero == 0.5 and not q.any()
+    q, scale, zero = quantize_uint8(torch.zeros(0, 4))
+    assert q.dtype == torch.uint8 and q.shape == (0, 4)
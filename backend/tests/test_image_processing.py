@@ -0,0 +1,91 @@
+"""
+Equivalence tests for the vectorized digit preprocessing (prepare_digits / digits_to_tensor)
+against the step-by-step PIL pipeline (prepare_digit / get_transform).
+
+Run from the project root: pytest
+"""
+import io
+import warnings
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+from backend.tests.helpers import synthetic_digits
+from backend.utils.image_processing import (
+    prepare_digit, prepare_digits, digits_to_tensor, get_transform, process_image_for_prediction,
+    prepare_upload,
+)
+
+# The resampling filters differ (LANCZOS vs. area/bilinear), so edge pixels may.
+MIN_AGREEMENT = 0.97
+MIN_IOU = 0.85
+
+@pytest.fixture(scope="module")
+def drawings():
+    return synthetic_digits(64, size=140)
+
+def reference_digits(images):
+    return np.stack([np.asarray(prepare_digit(Image.fromarray(image, mode='L'))) for image in images])
+
+def test_prepare_digits_matches_pil_pipeline(drawings):
+    reference = reference_digits(drawings)
+    digits = prepare_digits(drawings)
+    assert digits.shape == reference.shape == (len(drawings), 28, 28)
+    assert digits.dtype == np.uint8
+    assert set(np.unique(digits)) <= {0, 255}
+
+    assert (digits == reference).mean() >= MIN_AGREEMENT
+    a, b = reference > 0, digits > 0
+    iou = (a & b).sum(axis=(1, 2)) / np.maximum((a | b).sum(axis=(1, 2)), 1)
+    assert iou.mean() >= MIN_IOU
+
+def test_stack_and_list_inputs_agree(drawings):
+    stacked = prepare_digits(drawings[:8])
+    listed = prepare_digits([image for image in drawings[:8]])
+    assert np.array_equal(stacked, listed)
+
+def test_mixed_sizes():
+    images = synthetic_digits(2, size=140)
+    digits = prepare_digits([images[0], np.asarray(Image.fromarray(images[1]).resize((60, 90)))])
+    assert digits.shape == (2, 28, 28)
+
+def test_blank_image_gives_empty_canvas():
+    assert not prepare_digits(np.full((2, 40, 40), 255, dtype=np.uint8)).any()
+    assert prepare_digits([]).shape == (0, 28, 28)
+
+def test_mass_centering_puts_the_ink_in_the_middle(drawings):
+    for digit in prepare_digits(drawings[:16], centering="mass"):
+        ys, xs = np.nonzero(digit)
+        if len(ys):
+            # Placement is rounded to whole pixels and clamped to keep the digit on the canvas
+            assert abs(ys.mean() - 13.5) <= 4 and abs(xs.mean() - 13.5) <= 4
+
+def test_unknown_centering():
+    with pytest.raises(ValueError):
+        prepare_digits(np.zeros((1, 28, 28), dtype=np.uint8), centering="corner")
+
+def test_digits_to_tensor_matches_get_transform(drawings):
+    digits = prepare_digits(drawings[:8])
+    transform = get_transform()
+    expected = torch.stack([transform(Image.fromarray(digit, mode='L')) for digit in digits])
+    assert torch.allclose(digits_to_tensor(digits), expected, atol=1e-6)
+
+def test_process_image_for_prediction(drawings):
+    buffer = io.BytesIO()
+    Image.fromarray(drawings[0], mode='L').convert('RGB').save(buffer, format="PNG")
+    buffer.seek(0)
+    processed = process_image_for_prediction(buffer)
+    assert processed.size == (28, 28) and processed.mode == 'L'
+    assert np.array_equal(np.asarray(processed), prepare_digits(drawings[:1])[0])
+
+def test_process_image_for_prediction_rejects_garbage():
+    assert process_image_for_prediction(io.BytesIO(b"not an image")) is None
+    assert prepare_upload(io.BytesIO(b"not an image")) is None
+
+def test_digits_to_tensor_accepts_read_only_arrays(drawings):
+    digits = prepare_digits(drawings[:2])
+    frozen = digits.copy()
+    frozen.flags.writeable = False
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        assert torch.equal(digits_to_tensor(frozen), digits_to_tensor(digits))
@@ -0,0 +1,58 @@
+"""
+Activation capture for the architecture diagram's "pulse" effect.
+
+The frontend only shows one number per Linear/Conv2d layer: the mean absolute activation of
+the sample being displayed. Hooks are therefore armed only for the forward pass of a batch
+that will be reported, and reduce each output to that number on the training device. The
+numbers are copied to the host together, in one transfer, when the update is built.
+"""
+import torch
+import torch.nn as nn
+
+class ActivationCapture:
+    """Forward hooks on every Linear/Conv2d layer of a model, recording only while armed."""
+    def __init__(self, model):
+        self.armed = False
+        self._values = {}
+        self._hooks = [layer.register_forward_hook(self._hook(name))
+                       for name, layer in model.named_modules() if isinstance(layer, (nn.Linear, nn.Conv2d))]
+
+    def _hook(self, name):
+        def hook(module, input, output):
+            if self.armed and output.nelement() > 0:
+                # First sample only, reduced on the device: a 0-dim tensor instead of a full copy
+                self._values[name] = output[0].detach().abs().mean()
+        return hook
+
+    def read(self):
+        """Returns {layer name: mean |activation|} of the last armed pass and resets the capture."""
+        values, self._values = self._values, {}
+        if not values:
+            return {}
+        means = torch.stack([v.float() for v in values.values()]).cpu().tolist()
+        return dict(zip(values.keys(), means))
+
+    def remove(self):
+        for h in self._hooks:
+            h.remove()
+        self._hooks = []
+
+def capture_activations(model, sample):
+    """
+    Eager probe pass for models that train through a CompiledModel (whose graphs do not run
+    submodule hooks): runs `sample` through the eager module and returns the same
+    {layer name: mean |activation|} as ActivationCapture. Eval mode + no_grad, so the
+    training state is untouched.
+    """
+    capture = ActivationCapture(model)
+    capture.armed = True
+    was_training = model.training
+    model.eval()
+    try:
+        with torch.no_grad():
+            model(sample)
+    finally:
+        capture.remove()
+        if was_training:
+            model.train()
+    return capture.read()
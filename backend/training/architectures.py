@@ -50,8 +50,8 @@ class LeNet(nn.Module):
         # 2. C3 + S4
         x = F.max_pool2d(F.relu(self.conv2(x)), 2)
         
-        # Flatten
-        x = x.view(-1, 16 * 5 * 5)
+        # Flatten (reshape rather than view: the feature maps may be channels_last)
+        x = x.reshape(-1, 16 * 5 * 5)
         
         # 3. C5 (FC)
         x = F.relu(self.fc1(x))
@@ -0,0 +1,98 @@
+"""
+Micro-batching and adaptive micro-batch sizing.
+
+Heavy models on CPU (ResNet18 above all) can take seconds for a single forward/backward pass
+of a normal batch, and nothing else happens in that time: no stop check and no telemetry.
+Instead of shrinking the batch the user asked for, each batch is split into micro-batches
+whose gradients are accumulated before optimizer.step(). The optimizer still sees the
+requested batch size, and AdaptiveBatchSize picks the largest micro-batch that keeps one
+forward/backward pass under a latency target.
+"""
+
+# Target duration of one forward/backward pass (milliseconds), i.e. the worst-case delay
+# before a stop request or a telemetry update is noticed.
+DEFAULT_TARGET_STEP_MS = 200
+
+# BatchNorm cannot compute training statistics from a single sample.
+MIN_MICRO_BATCH = 2
+
+# Adjustments in a row that keep the size before an AdaptiveBatchSize counts as settled.
+SETTLE_ADJUSTMENTS = 2
+
+class MicroBatcher:
+    """
+    Cuts batches into micro-batches of a fixed size (the 'micro_batch_size' config option).
+    A size below min_size is raised to it, so BatchNorm layers always get several samples.
+    """
+    def __init__(self, size, min_size=MIN_MICRO_BATCH):
+        self.min_size = max(1, int(min_size))
+        self.size = max(self.min_size, int(size))
+
+    def observe(self, batch_size, seconds):
+        """Latency feedback; a fixed size ignores it."""
+        return self.size
+
+    def split(self, batch_size):
+        """
+        Sizes of the micro-batches a batch of `batch_size` samples is cut into.
+        A remainder smaller than min_size is merged into the previous micro-batch.
+        """
+        size = max(1, self.size)
+        sizes = [size] * (batch_size // size)
+        remainder = batch_size - size * len(sizes)
+        if remainder:
+            if sizes and remainder < self.min_size:
+                sizes[-1] += remainder
+            else:
+                sizes.append(remainder)
+        return sizes
+
+class AdaptiveBatchSize(MicroBatcher):
+    """
+    Picks the micro-batch size from measured step latencies.
+
+    The per-sample cost is smoothed over recent steps and the size is set to the largest
+    power of two (or the full batch) whose expected latency fits the target. Growth is at most
+    2x per adjustment; a step far over the target shrinks the size right away.
+    """
+    def __init__(self, max_size, target_ms=DEFAULT_TARGET_STEP_MS, min_size=MIN_MICRO_BATCH, smoothing=0.3, patience=3):
+        self.max_size = max(1, int(max_size))
+        # Start small: a first oversized step would block for its whole duration
+        super().__init__(min(self.max_size, max(min_size, 8)), min(self.max_size, max(1, int(min_size))))
+        self.target = max(1, float(target_ms)) / 1000.
+        self.smoothing = smoothing
+        self.patience = patience
+        self._cost = None
+        self._observed = 0
+        self._warm = False
+        self._unchanged = 0
+
+    @property
+    def settled(self):
+        """True once the last few adjustments kept the size, i.e. the size the loop will keep running."""
+        return self._unchanged >= SETTLE_ADJUSTMENTS
+
+    def observe(self, batch_size, seconds):
+        """Records the latency of one forward/backward pass over `batch_size` samples."""
+        if not self._warm:
+            # The first pass pays for lazy initialization (allocator, kernels) and is not representative
+            self._warm = True
+            return self.size
+        cost = seconds / max(1, batch_size)
+        self._cost = cost if self._cost is None else self.smoothing * cost + (1 - self.smoothing) * self._cost
+        self._observed += 1
+        if seconds > 2 * self.target or self._observed >= self.patience:
+            self._adjust()
+        return self.size
+
+    def _adjust(self):
+        self._observed = 0
+        fitting = int(self.target / self._cost)
+        if fitting >= self.max_size:
+            proposed = self.max_size
+        else:
+            # Round down to a power of two, so the kernels see a handful of stable shapes
+            proposed = 1 << max(0, fitting.bit_length() - 1)
+        size = max(self.min_size, min(proposed, self.size * 2, self.max_size))
+        self._unchanged = self._unchanged + 1 if size == self.size else 0
+        self.size = size
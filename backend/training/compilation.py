@@ -0,0 +1,80 @@
+"""
+Opt-in compiled execution of the models from architectures.py ('compile' training config option).
+
+  - 'compile': torch.compile (TorchDynamo + Inductor), one static graph per batch shape.
+  - 'script':  TorchScript tracing, one trace per batch shape and train/eval mode.
+               Also the fallback when torch.compile is missing or fails on this platform.
+
+The eager module stays the owner of the parameters: the optimizer, the weights API and
+save_model keep using it, and CompiledModel only replaces its forward call.
+
+Caching: Dynamo keeps compiled graphs on the model class's forward code, guarded on tensor
+shapes rather than on module identity, so a restarted session (new model instance, same
+architecture and batch shape) reuses them without compiling again. Inductor also keeps its
+kernels in an on-disk cache, which survives server restarts. Traces share the parameters of
+the module they were made from, so they are cached per model and shape.
+
+Forward hooks on submodules do not run inside compiled graphs (and would force graph breaks),
+so activations for the visualizations come from activations.capture_activations(), an eager
+probe pass.
+"""
+import torch
+
+COMPILE_MODES = ("off", "compile", "script")
+
+# (architecture, input shape, training, backend) already compiled in this process, for the logs.
+_COMPILED_SHAPES = set()
+
+def resolve_compile_mode(value):
+    """Normalizes the 'compile' config option (bool or mode name) to one of COMPILE_MODES."""
+    if value is True:
+        return "compile"
+    if value in COMPILE_MODES:
+        return value
+    return "off"
+
+class CompiledModel:
+    """Callable stand-in for an eager model that runs it through torch.compile or TorchScript."""
+    def __init__(self, model, architecture, mode="compile", log=print):
+        self.model = model
+        self.architecture = architecture
+        self.log = log
+        self.backend = "torchscript" if mode == "script" or not hasattr(torch, "compile") else "inductor"
+        self._compiled = torch.compile(model, dynamic=False) if self.backend == "inductor" else None
+        self._traces = {}
+        # True when the last call had to compile, so its latency says nothing about the model
+        self.compiled_last_call = False
+
+    def __call__(self, x):
+        key = (self.architecture, tuple(x.shape), self.model.training, self.backend)
+        if self.backend == "inductor":
+            fresh = key not in _COMPILED_SHAPES
+        else:
+            fresh = (tuple(x.shape), self.model.training) not in self._traces
+        self.compiled_last_call = fresh
+        if fresh:
+            self.log(f"⚙️ Compiling {self.architecture} ({self.backend}) for input {list(x.shape)}, "
+                     f"{'train' if self.model.training else 'eval'} mode...")
+        if self.backend == "inductor":
+            try:
+                output = self._compiled(x)
+            except Exception as e:
+                # No C++ toolchain, unsupported Python version, ...: trace instead
+                self.log(f"⚠️ torch.compile failed ({type(e).__name__}: {e}), falling back to TorchScript")
+                self.backend = "torchscript"
+                return self(x)
+        else:
+            output = self._trace(x)(x)
+        _COMPILED_SHAPES.add(key)
+        return output
+
+    def _trace(self, x):
+        key = (tuple(x.shape), self.model.training)
+        if key not in self._traces:
+            # Tracing runs one forward pass: keep it from updating the BatchNorm running stats
+            buffers = [b.clone() for b in self.model.buffers()]
+            self._traces[key] = torch.jit.trace(self.model, x, check_trace=False)
+            with torch.no_grad():
+                for buffer, saved in zip(self.model.buffers(), buffers):
+                    buffer.copy_(saved)
+        return self._traces[key]
@@ -1,47 +1,348 @@
+import math
+import os
+import torch
+import torch.nn.functional as F
+from eventlet import patcher
 from torchvision import datasets, transforms
 from torch.utils.data import DataLoader
 
-def get_dataloader(dataset_name, batch_size=64, train=True):
+# Real OS threads/queues for the background prefetcher (see trainer.py for why).
+_native_threading = patcher.original('threading')
+_native_queue = patcher.original('queue')
+
+# Normalization constants (mean, std) applied to each dataset.
+DATASET_STATS = {
+    "mnist": ((0.1307,), (0.3081,)),
+    "fashion-mnist": ((0.1307,), (0.3081,)),
+    "cifar-10": ((0.5,), (0.5,)),
+}
+
+# Spatial size every model in architectures.py expects.
+IMAGE_SIZE = (28, 28)
+
+# ITU-R 601-2 luma weights, the same ones PIL uses for convert('L') / Grayscale().
+_LUMA_WEIGHTS = (0.299, 0.587, 0.114)
+
+# Process-wide cache of decoded datasets: (dataset_name, train) -> (images, targets).
+# Images are stored once as contiguous uint8 tensors in their native layout
+# ([N, 1, 28, 28] for MNIST, [N, 3, 32, 32] for CIFAR-10, ~47 MB / ~150 MB),
+# so restarting a training session never touches the disk or PIL again.
+_TENSOR_CACHE = {}
+
+# Page-locked staging buffers per CachedTensorLoader: a batch being copied to the GPU
+# asynchronously must not be overwritten, so gathering alternates between a few of them.
+STAGING_BUFFERS = 2
+
+def _get_dataset_class(dataset_name):
+    """Maps the dataset name used by the frontend to its torchvision class."""
+    if dataset_name == "fashion-mnist":
+        return datasets.FashionMNIST
+    if dataset_name == "cifar-10":
+        return datasets.CIFAR10
+    return datasets.MNIST
+
+def _load_tensors(dataset_name, train):
+    """
+    Decodes a whole dataset split into (uint8 images, int64 targets) tensors, once per process.
+    """
+    key = (dataset_name, train)
+    if key in _TENSOR_CACHE:
+        return _TENSOR_CACHE[key]
+
+    dataset = _get_dataset_class(dataset_name)('./data', train=train, download=True)
+    if dataset_name == "cifar-10":
+        # CIFAR-10 keeps its pixels as a numpy array [N, 32, 32, 3] (HWC).
+        # Grayscale + Resize are deferred to the batched BatchTransform on the training device.
+        images = torch.from_numpy(dataset.data).permute(0, 3, 1, 2)
+        targets = torch.tensor(dataset.targets, dtype=torch.long)
+    else:
+        # MNIST-style datasets already keep their pixels as a uint8 tensor [N, 28, 28].
+        images = dataset.data.unsqueeze(1)
+        targets = dataset.targets.long()
+
+    _TENSOR_CACHE[key] = (images.contiguous(), targets.contiguous())
+    return _TENSOR_CACHE[key]
+
+class BatchTransform:
+    """
+    Vectorized replacement for the per-sample torchvision pipeline
+    (Grayscale -> Resize -> ToTensor -> Normalize).
+    Works on a whole uint8 batch [B, C, H, W] at once, on whichever device the batch lives on.
+    """
+    def __init__(self, mean, std, size=IMAGE_SIZE):
+        self.mean = torch.tensor(mean).view(1, -1, 1, 1)
+        self.std = torch.tensor(std).view(1, -1, 1, 1)
+        self.size = tuple(size)
+        self._luma = torch.tensor(_LUMA_WEIGHTS).view(1, 3, 1, 1)
+
+    def __call__(self, images):
+        device = images.device
+        # ToTensor(): scale to [0, 1]
+        x = images.float().div_(255)
+        if x.size(1) == 3:
+            # Grayscale(): weighted sum over the RGB channels
+            x = (x * self._luma.to(device)).sum(dim=1, keepdim=True)
+        if tuple(x.shape[-2:]) != self.size:
+            # Resize(): antialiased bilinear, matching torchvision's PIL resize
+            x = F.interpolate(x, size=self.size, mode='bilinear', align_corners=False, antialias=True)
+        # Normalize(): standardize with the dataset statistics
+        return (x - self.mean.to(device)) / self.std.to(device)
+
+class CachedTensorLoader:
+    """
+    A lightweight DataLoader replacement that serves batches straight from a cached tensor.
+    Batches are taken by index slicing, moved to the training device while still uint8,
+    and converted there by a BatchTransform in one vectorized step,
+    instead of running the torchvision transforms through PIL for every sample of every epoch.
+
+    With pin_memory=True (CUDA only), batches are gathered into reused page-locked staging
+    buffers and copied with non_blocking=True, so the copy overlaps with compute. The cached
+    dataset itself stays in pageable memory.
+    """
+    def __init__(self, images, targets, mean, std, batch_size=64, shuffle=True, drop_last=True, device=None, pin_memory=False):
+        self.images = images
+        self.targets = targets
+        self.transform = BatchTransform(mean, std)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.device = torch.device(device) if device is not None else torch.device('cpu')
+        self.pin_memory = pin_memory and self.device.type == 'cuda'
+        # [(images, targets, copy done event)], allocated on first use
+        self._staging = []
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.images) // self.batch_size
+        return math.ceil(len(self.images) / self.batch_size)
+
+    def __iter__(self):
+        total = len(self.images)
+        order = torch.randperm(total) if self.shuffle else None
+        for batch_idx in range(len(self)):
+            start = batch_idx * self.batch_size
+            end = min(start + self.batch_size, total)
+            idx = order[start:end] if order is not None else None
+            if self.pin_memory:
+                images, targets = self._to_device_pinned(batch_idx, start, end, idx)
+            else:
+                if idx is not None:
+                    images, targets = self.images[idx], self.targets[idx]
+                else:
+                    images, targets = self.images[start:end], self.targets[start:end]
+                images, targets = images.to(self.device), targets.to(self.device)
+            yield self.transform(images), targets
+
+    def _to_device_pinned(self, batch_idx, start, end, idx):
+        """Gathers one batch into a page-locked staging buffer and starts its copy to the device."""
+        if not self._staging:
+            self._staging = [(torch.empty((self.batch_size,) + tuple(self.images.shape[1:]), dtype=self.images.dtype).pin_memory(),
+                              torch.empty(self.batch_size, dtype=self.targets.dtype).pin_memory(),
+                              None) for _ in range(STAGING_BUFFERS)]
+        slot = batch_idx % len(self._staging)
+        images_buf, targets_buf, copied = self._staging[slot]
+        if copied is not None:
+            # The previous copy out of this buffer must be done before it is overwritten
+            copied.synchronize()
+        images, targets = images_buf[:end - start], targets_buf[:end - start]
+        if idx is not None:
+            torch.index_select(self.images, 0, idx, out=images)
+            torch.index_select(self.targets, 0, idx, out=targets)
+        else:
+            images.copy_(self.images[start:end])
+            targets.copy_(self.targets[start:end])
+        images = images.to(self.device, non_blocking=True)
+        targets = targets.to(self.device, non_blocking=True)
+        copied = torch.cuda.Event()
+        copied.record()
+        self._staging[slot] = (images_buf, targets_buf, copied)
+        return images, targets
+
+class BackgroundPrefetcher:
+    """
+    Wraps any batch iterable and produces its batches ahead of time on a native thread,
+    so data preparation overlaps with the forward/backward pass instead of running in series.
+    This is also the fallback for DataLoader worker processes, which cannot be spawned
+    once eventlet has monkey-patched the standard library.
+    """
+    def __init__(self, loader, depth=2):
+        self.loader = loader
+        self.depth = max(1, depth)
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        batches = _native_queue.Queue(maxsize=self.depth)
+        stop = _native_threading.Event()
+        done = object()
+
+        def offer(item):
+            # Bounded put that gives up once the consumer has gone away
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except _native_queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                for batch in self.loader:
+                    if not offer(batch):
+                        return
+            except Exception as e:
+                offer(e)
+                return
+            offer(done)
+
+        producer = _native_threading.Thread(target=produce, name="nntv-prefetch", daemon=True)
+        producer.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is done:
+                    return
+                if isinstance(batch, Exception):
+                    raise batch
+                yield batch
+        finally:
+            # Unblock the producer if the consumer stopped early (e.g. training was stopped)
+            stop.set()
+
+def resolve_loader_profile(options=None, device=None, threaded=True):
+    """
+    Turns the optional 'loader' section of a training config into a complete loader profile:
+    {workers, prefetch_factor, persistent_workers, pin_memory, backend}.
+
+    backend is 'process' for regular DataLoader worker processes, 'thread' when those cannot be
+    spawned (eventlet monkey-patching breaks torch's multiprocessing queues) and a native
+    prefetch thread is used instead, or 'none' when the consumer runs on the eventlet hub
+    (threaded=False) and must not block on a background thread.
+    """
+    options = options or {}
+    device = torch.device(device) if device is not None else torch.device('cpu')
+
+    # Linux/macOS: a few workers, leaving most cores to PyTorch's compute threads.
+    # Windows spawn-based workers are slow to start and fragile, so default to 0 there.
+    default_workers = min(4, max(1, (os.cpu_count() or 2) // 2)) if os.name != 'nt' else 0
+    workers = max(0, int(options.get('workers', default_workers)))
+    prefetch_factor = max(0, int(options.get('prefetch_factor', 2)))
+    persistent_workers = bool(options.get('persistent_workers', workers > 0))
+    # Pinned memory only helps host-to-GPU copies
+    pin_memory = bool(options.get('pin_memory', device.type == 'cuda')) and device.type == 'cuda'
+
+    workers_available = not patcher.is_monkey_patched('thread')
+    if workers > 0 and workers_available:
+        backend = 'process'
+    elif threaded and prefetch_factor > 0:
+        backend = 'thread'
+    else:
+        backend = 'none'
+        workers = 0
+
+    return {
+        "workers": workers,
+        "prefetch_factor": prefetch_factor,
+        "persistent_workers": persistent_workers and workers > 0,
+        "pin_memory": pin_memory,
+        "backend": backend,
+    }
+
+def _prefetch_depth(profile, cache):
+    """Batches the prefetch thread of get_dataloader() keeps ready, 0 when there is none."""
+    if profile['backend'] == 'none' or profile['prefetch_factor'] <= 0:
+        return 0
+    if cache:
+        return profile['prefetch_factor']
+    if profile['backend'] == 'thread':
+        return max(1, profile['workers']) * profile['prefetch_factor']
+    return 0
+
+def describe_loader(profile, cache):
+    """
+    What get_dataloader() actually runs for a profile and cache setting, for the start log.
+    Worker processes only exist for uncached datasets without monkey-patching; otherwise the
+    'workers' and 'persistent_workers' options have no effect.
+    """
+    if not cache and profile['backend'] == 'process':
+        workers = profile['workers']
+        text = (f"{workers} worker process{'es' if workers != 1 else ''}, prefetch {profile['prefetch_factor']}"
+                f"{', persistent' if profile['persistent_workers'] else ''}")
+    else:
+        depth = _prefetch_depth(profile, cache)
+        text = f"1 prefetch thread, depth {depth}" if depth else "no prefetching"
+    source = "cached tensors" if cache else "torchvision dataset"
+    return f"{source}, {text}, pinned={profile['pin_memory']}"
+
+def get_dataloader(dataset_name, batch_size=64, train=True, cache=True, device=None, profile=None):
     """
     Creates a PyTorch DataLoader for the specified dataset.
     Handles normalizing, resizing, and preparation so the model gets consistent input.
+
+    With cache=True (default) the dataset is decoded once per process and served from memory
+    by a CachedTensorLoader, which yields batches already transformed on `device`.
+    cache=False uses the classic torchvision DataLoader pipeline (CPU tensors).
+
+    `profile` comes from resolve_loader_profile() and controls workers, prefetching and pinning.
     """
-    # Default transforms for MNIST: Convert to Tensor and Normalize 
+    if profile is None:
+        profile = resolve_loader_profile(device=device)
+
+    dataset_name = dataset_name.lower()
+    if dataset_name not in DATASET_STATS:
+        dataset_name = "mnist"
+    mean, std = DATASET_STATS[dataset_name]
+
+    if cache:
+        images, targets = _load_tensors(dataset_name, train)
+        # drop_last=True prevents BatchNorm errors if the last batch has size 1
+        loader = CachedTensorLoader(images, targets, mean, std, batch_size=batch_size, shuffle=train, drop_last=True,
+                                    device=device, pin_memory=profile['pin_memory'])
+        # Nothing to decode here, so worker processes would not help; a prefetch thread still
+        # overlaps the gather + transform of the next batch with the current training step.
+        depth = _prefetch_depth(profile, cache)
+        if depth:
+            return BackgroundPrefetcher(loader, depth=depth)
+        return loader
+
+    # Default transforms for MNIST: Convert to Tensor and Normalize
     # (Subtract mean 0.1307, Divide by std 0.3081) to center data around 0.
     transform_list = [
         transforms.ToTensor(),
-        transforms.Normalize((0.1307,), (0.3081,))
+        transforms.Normalize(mean, std)
     ]
 
-    dataset_class = datasets.MNIST
-    
-    # Select dataset class based on string name
-    if dataset_name.lower() == "fashion-mnist":
-        dataset_class = datasets.FashionMNIST
-        
-    elif dataset_name.lower() == "cifar-10":
-        dataset_class = datasets.CIFAR10
+    if dataset_name == "cifar-10":
         # SPECIAL CASE: CIFAR-10 is color (RGB) and larger (32x32).
         # To make it work with our existing simple models (which expect 1-channel 28x28),
         # we forcibly grayscale and resize it. This is a simplification for educational demo purposes.
         transform_list = [
             transforms.Grayscale(num_output_channels=1),
-            transforms.Resize((28, 28)),
+            transforms.Resize(IMAGE_SIZE),
             transforms.ToTensor(),
-            transforms.Normalize((0.5,), (0.5,)) # Simple normalization for general data
+            transforms.Normalize(mean, std) # Simple normalization for general data
         ]
 
     # Combine the list of transforms into a single pipeline
     transform = transforms.Compose(transform_list)
-        
+
     # Download the dataset if missing and apply the transforms
-    dataset = dataset_class('./data', train=train, download=True, transform=transform)
-        
+    dataset = _get_dataset_class(dataset_name)('./data', train=train, download=True, transform=transform)
+
     # Return loading iterator (shuffled for training to prevent ordering bias)
     # drop_last=True prevents BatchNorm errors if the last batch has size 1
-    # num_workers=2 speeds up data loading for GPU usage
-    import os
-    workers = 2 if os.name != 'nt' else 0 # Windows sometimes struggles with workers > 0 in certain envs, let's keep 0 for safety or user can try 2
-    # Actually, let's try 0 for now to be safe against Windows spawn errors, but mention it.
-    # The low usage is likely batch size.
-    return DataLoader(dataset, batch_size=batch_size, shuffle=train, drop_last=True, num_workers=0)
+    if profile['backend'] == 'process':
+        return DataLoader(dataset, batch_size=batch_size, shuffle=train, drop_last=True,
+                          num_workers=profile['workers'],
+                          prefetch_factor=profile['prefetch_factor'] or None,
+                          persistent_workers=profile['persistent_workers'],
+                          pin_memory=profile['pin_memory'])
+
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=train, drop_last=True, num_workers=0,
+                        pin_memory=profile['pin_memory'])
+    depth = _prefetch_depth(profile, cache)
+    if depth:
+        return BackgroundPrefetcher(loader, depth=depth)
+    return loader
@@ -0,0 +1,113 @@
+"""
+Inference snapshots.
+
+predict() used to switch the live training model to eval() and back, racing the training loop
+(which may be in the middle of a step on another thread) and making predictions wait for it.
+Instead, the training loop periodically publishes an InferenceSnapshot: a frozen, eval-mode
+copy of the model at one weights version. Predictions only ever read the current snapshot, so
+they neither perturb training nor contend with it, and the copy can be optimized for latency
+(Conv+BN fusion, memory format, compilation) without touching the training model.
+
+Single-image predictions that arrive together (a whole class uploading their drawings) are
+merged by a PredictionBatcher into one forward pass over the snapshot.
+"""
+import copy
+import time
+import eventlet
+import torch
+from eventlet import event, tpool
+from .compilation import CompiledModel
+from .memory_format import fuse_for_inference, to_memory_format
+
+# Optimizer steps between two published snapshots ('snapshot_every' config option).
+DEFAULT_SNAPSHOT_EVERY = 50
+
+# Single-image requests arriving within this window are merged into one forward pass (seconds).
+DEFAULT_BATCH_WINDOW = 0.005
+
+# Largest batch sent through a snapshot at once.
+MAX_PREDICT_BATCH = 64
+
+def _strip_hooks(model):
+    """Drops forward hooks copied from the training model (they feed its activation capture)."""
+    for module in model.modules():
+        module._forward_pre_hooks.clear()
+        module._forward_hooks.clear()
+
+class InferenceSnapshot:
+    """Immutable eval-mode copy of a model at one weights version, used for predictions."""
+    def __init__(self, model, version, memory_format=torch.contiguous_format, fuse=False,
+                 compile_mode="off", architecture=None, log=print):
+        # FX fusion gives every snapshot its own generated forward, which torch.compile would
+        # have to recompile each time; compiled snapshots stay unfused.
+        if fuse and compile_mode == "off":
+            self.model = fuse_for_inference(model, memory_format)
+        else:
+            self.model = copy.deepcopy(model).eval().to(memory_format=memory_format)
+        _strip_hooks(self.model)
+        self.model.requires_grad_(False)
+        self.forward = self.model
+        if compile_mode != "off":
+            self.forward = CompiledModel(self.model, architecture, compile_mode, log=log)
+        self.version = version
+        self.memory_format = memory_format
+        self.fused = fuse and compile_mode == "off"
+        self.created_at = time.time()
+
+    def __call__(self, inputs):
+        """Logits for a batch of inputs. Safe to call from any thread, concurrently with training."""
+        with torch.no_grad():
+            return self.forward(to_memory_format(inputs, self.memory_format))
+
+def run_snapshot(snapshot, inputs, max_batch=MAX_PREDICT_BATCH):
+    """Logits for any number of inputs, in chunks of max_batch, computed in a native thread off the hub."""
+    outputs = [tpool.execute(snapshot, chunk) for chunk in inputs.split(max_batch)]
+    return torch.cat(outputs)
+
+class PredictionBatcher:
+    """
+    Merges concurrent single-image predictions into one forward pass.
+
+    Runs on the eventlet hub: every request is a green thread that parks on an Event. The first
+    request of a batch schedules a flush `window` seconds later (sooner once max_batch requests
+    are waiting); the flush runs the snapshot once over all of them and hands each caller its row.
+    """
+    def __init__(self, get_snapshot, window=DEFAULT_BATCH_WINDOW, max_batch=MAX_PREDICT_BATCH):
+        self.get_snapshot = get_snapshot
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []
+        self._timer = None
+        # Counters, to see how well requests are merged
+        self.requests = 0
+        self.batches = 0
+
+    def submit(self, inputs):
+        """Returns (logits [1, classes], snapshot) for one input [1, C, H, W]."""
+        done = event.Event()
+        self._pending.append((inputs, done))
+        self.requests += 1
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = eventlet.spawn_after(self.window, self._flush)
+        return done.wait()
+
+    def _flush(self):
+        if self._timer is not None:
+            # No-op when called from the timer itself
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        self.batches += 1
+        try:
+            snapshot = self.get_snapshot()
+            logits = run_snapshot(snapshot, torch.cat([inputs for inputs, _ in batch]), self.max_batch)
+        except Exception as e:
+            for _, done in batch:
+                done.send_exception(e)
+            return
+        for i, (_, done) in enumerate(batch):
+            done.send((logits[i:i + 1], snapshot))
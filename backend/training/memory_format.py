@@ -0,0 +1,39 @@
+"""
+Memory layout and inference fusion helpers for the convolutional models (LeNet, ResNet18).
+
+oneDNN, PyTorch's CPU backend for convolutions, works natively on NHWC. With the default NCHW
+layout every convolution pays for reordering its input and output, which channels_last
+('memory_format' training config option) avoids. For inference, fuse_for_inference() also
+folds every BatchNorm into the preceding convolution, removing one pass over each
+activation map.
+
+Which layout is faster depends on the CPU and the batch size. Compare them with
+`python -m backend.benchmarks.memory_format`.
+"""
+import copy
+import torch
+from torch.fx.experimental.optimization import fuse
+
+MEMORY_FORMATS = {
+    "contiguous": torch.contiguous_format,
+    "channels_last": torch.channels_last,
+}
+
+def resolve_memory_format(value):
+    """Maps the 'memory_format' config option to a torch.memory_format (default: contiguous)."""
+    return MEMORY_FORMATS.get(value, torch.contiguous_format)
+
+def to_memory_format(batch, memory_format):
+    """Returns an image batch [B, C, H, W] in the given layout (no copy if it already is)."""
+    if memory_format is torch.contiguous_format or batch.dim() != 4:
+        return batch
+    return batch.contiguous(memory_format=memory_format)
+
+def fuse_for_inference(model, memory_format=torch.contiguous_format):
+    """
+    Eval-mode copy of `model` with every Conv2d+BatchNorm2d pair folded into one Conv2d,
+    in the given memory format. The copy does not follow later training steps, and the
+    layers are renamed by FX, so it is meant for predictions only.
+    """
+    fused = fuse(copy.deepcopy(model).eval(), inplace=True)
+    return fused.to(memory_format=memory_format)
@@ -0,0 +1,237 @@
+"""
+Training job scheduler.
+
+Instead of rejecting a start request when the server is at its concurrency limit, the
+configuration is queued as a job. Up to `max_running` jobs train at once (the registry's
+NNTV_MAX_CONCURRENT, derived from the core count) and each one gets the registry's
+torch.set_num_threads share, so the machine stays busy without oversubscribing threads.
+
+Queue positions and ETAs are available over REST (/api/jobs) and pushed to each waiting
+session's room as 'queue_update' events.
+"""
+import time
+import uuid
+from collections import deque
+from backend.extensions import socketio
+from .sessions import registry
+from .trainer import session_room
+
+# How often finished jobs are detected and queue updates are pushed (seconds).
+WATCH_INTERVAL = 1.0
+
+# Assumed duration of a job before any run has finished (seconds).
+DEFAULT_JOB_SECONDS = 120.0
+
+class Job:
+    """One submitted training run."""
+    def __init__(self, model_id, config):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.model_id = model_id
+        self.config = config
+        self.status = 'queued'  # queued -> running -> done | cancelled | failed
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # Trainer.generation of the run this job started: the session may start newer runs
+        self.generation = None
+
+class JobScheduler:
+    """
+    FIFO queue of jobs on top of a SessionRegistry.
+    Runs on the eventlet hub (routes + one watcher green thread), so no locking is needed.
+    """
+    def __init__(self, registry, history_size=20):
+        self.registry = registry
+        self._queue = deque()
+        self._running = {}      # job_id -> Job
+        self._jobs = {}         # job_id -> Job (all jobs still of interest)
+        self._durations = deque(maxlen=history_size)
+        self._watching = False
+
+    @property
+    def max_running(self):
+        return self.registry.max_concurrent
+
+    def submit(self, model_id, config):
+        """Queues a training run for a session and starts it right away if a slot is free."""
+        trainer = self.registry.get(model_id)
+        job = self.job_for(model_id)
+        # A stopped run whose loop is still exiting does not block a restart: the new job
+        # waits in the queue until it has exited
+        if (job is not None and job.status == 'queued') or (trainer is not None and trainer.is_running):
+            raise ValueError("already_running")
+        job = Job(model_id, config)
+        self._jobs[job.job_id] = job
+        self._queue.append(job)
+        # An idle session with a queued job must survive until the job starts
+        self.registry.pin(model_id)
+        self._dispatch()
+        self._ensure_watcher()
+        return job
+
+    def cancel(self, job_id):
+        """Removes a queued job. Running jobs are stopped through their trainer instead."""
+        job = self._jobs.get(job_id)
+        if job is None or job.status != 'queued':
+            return False
+        self._queue.remove(job)
+        self.registry.unpin(job.model_id)
+        job.status = 'cancelled'
+        job.finished_at = time.time()
+        self._broadcast_positions()
+        return True
+
+    def job_for(self, model_id):
+        """The queued or running job of a session, if any."""
+        for job in list(self._queue) + list(self._running.values()):
+            if job.model_id == model_id:
+                return job
+        return None
+
+    def describe(self, job):
+        """Public view of a job, including its queue position and estimated start/finish."""
+        info = {
+            "job_id": job.job_id,
+            "model_id": job.model_id,
+            "status": job.status,
+            "position": None,
+            "eta_start": None,
+            "eta_finish": None,
+        }
+        if job.error:
+            info["error"] = job.error
+        if job.status == 'queued':
+            position = list(self._queue).index(job)
+            start, finish = self._estimate(position)
+            info.update(position=position + 1, eta_start=start, eta_finish=finish)
+        elif job.status == 'running':
+            info["eta_finish"] = self._remaining(job)
+        return info
+
+    def snapshot(self):
+        """Queue state for /api/jobs."""
+        return {
+            "max_running": self.max_running,
+            "running": [self.describe(job) for job in self._running.values()],
+            "queued": [self.describe(job) for job in self._queue],
+        }
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    # --- Internals ---
+
+    def _dispatch(self):
+        """Starts queued jobs while there are free slots."""
+        changed = False
+        while len(self._running) < self.max_running:
+            job = next((job for job in self._queue if not self._stopping(job.model_id)), None)
+            if job is None:
+                break
+            self._queue.remove(job)
+            self.registry.unpin(job.model_id)
+            try:
+                trainer = self.registry.start(job.model_id, job.config)
+            except Exception as e:
+                # A failed setup (e.g. dataset download) must not keep holding the slot
+                trainer = self.registry.get(job.model_id)
+                if trainer is not None:
+                    trainer.stop()
+                job.status = 'failed'
+                job.error = str(e)
+                job.finished_at = time.time()
+                # The client may be waiting in 'queued' for this job: tell it
+                self._notify(job)
+                changed = True
+                continue
+            job.status = 'running'
+            job.started_at = time.time()
+            job.generation = trainer.generation
+            self._running[job.job_id] = job
+            changed = True
+            self._notify(job)
+        if changed:
+            self._broadcast_positions()
+
+    def _reap(self):
+        """Marks jobs whose run has ended (loop exited, not just stopped) as done and frees their slots."""
+        for job_id, job in list(self._running.items()):
+            trainer = self.registry.get(job.model_id)
+            if trainer is None or trainer.generation != job.generation or not trainer.busy:
+                del self._running[job_id]
+                job.status = 'done'
+                job.finished_at = time.time()
+                self._durations.append(job.finished_at - job.started_at)
+                self._notify(job)
+        # Forget finished jobs after a while
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at and time.time() - job.finished_at > 600:
+                del self._jobs[job_id]
+
+    def _stopping(self, model_id):
+        """True while a stopped run of the session is still exiting; its next job has to wait."""
+        trainer = self.registry.get(model_id)
+        return trainer is not None and not trainer.is_running and trainer.worker_alive()
+
+    def _ensure_watcher(self):
+        if not self._watching:
+            self._watching = True
+            socketio.start_background_task(self._watch)
+
+    def _watch(self):
+        """Green background task: frees slots of finished jobs and refreshes ETAs."""
+        while self._queue or self._running:
+            socketio.sleep(WATCH_INTERVAL)
+            self._reap()
+            self._dispatch()
+            self._broadcast_positions()
+        self._watching = False
+
+    def _typical_duration(self):
+        if self._durations:
+            return sum(self._durations) / len(self._durations)
+        # Fall back to projecting the running jobs' total duration from their progress
+        trainers = [t for t in self._running_trainers() if t.progress > 0.05]
+        projected = [(time.time() - t.started_at) / t.progress for t in trainers]
+        return sum(projected) / len(projected) if projected else DEFAULT_JOB_SECONDS
+
+    def _running_trainers(self):
+        trainers = [self.registry.get(job.model_id) for job in self._running.values()]
+        return [t for t in trainers if t is not None and t.started_at]
+
+    def _remaining(self, job):
+        """Estimated seconds until a running job finishes."""
+        trainer = self.registry.get(job.model_id)
+        if trainer is None or not trainer.started_at:
+            return None
+        if trainer.progress <= 0:
+            return self._typical_duration()
+        elapsed = time.time() - trainer.started_at
+        return elapsed * (1 - trainer.progress) / trainer.progress
+
+    def _estimate(self, position):
+        """
+        (seconds until start, seconds until finish) for the queued job at `position`,
+        simulating the slots: each slot frees up when its current job is expected to end.
+        """
+        slots = sorted(self._remaining(job) or 0.0 for job in self._running.values())
+        slots += [0.0] * max(0, self.max_running - len(slots))
+        duration = self._typical_duration()
+        start = 0.0
+        for _ in range(position + 1):
+            slots.sort()
+            start = slots[0]
+            slots[0] = start + duration
+        return start, start + duration
+
+    def _notify(self, job):
+        # By room name, so it also reaches clients of a session that no longer exists
+        socketio.emit('queue_update', self.describe(job), to=session_room(job.model_id))
+
+    def _broadcast_positions(self):
+        for job in self._queue:
+            self._notify(job)
+
+# Global scheduler shared by the API routes
+scheduler = JobScheduler(registry)
@@ -0,0 +1,117 @@
+"""
+Training session registry.
+
+Every session (identified by the model_id returned from /api/create-model) owns its own
+Trainer: model, optimizer, training loop and weight snapshots. This lets several users
+train on one shared server instead of being refused while someone else trains.
+
+Admission control keeps the machine from being oversubscribed:
+  - NNTV_MAX_SESSIONS:        sessions kept in memory (idle ones are evicted first)
+  - NNTV_MAX_CONCURRENT:      sessions allowed to train at the same time
+  - NNTV_THREADS_PER_SESSION: PyTorch intra-op threads given to each training session
+"""
+import os
+import time
+import uuid
+from .trainer import Trainer
+
+# Session used by clients that do not send a model_id (single-user setups, old frontends).
+DEFAULT_SESSION_ID = "default"
+
+_CPU_COUNT = os.cpu_count() or 1
+MAX_SESSIONS = int(os.environ.get('NNTV_MAX_SESSIONS', 32))
+MAX_CONCURRENT = int(os.environ.get('NNTV_MAX_CONCURRENT', max(1, _CPU_COUNT // 2)))
+THREADS_PER_SESSION = int(os.environ.get('NNTV_THREADS_PER_SESSION', max(1, _CPU_COUNT // MAX_CONCURRENT)))
+
+# How long start() waits for a stopped run of the same session to finish its last step (seconds).
+STOP_TIMEOUT = 10.0
+
+class AdmissionError(Exception):
+    """Raised when a session cannot be created or started right now. Carries an HTTP status."""
+    def __init__(self, message, status=503):
+        super().__init__(message)
+        self.status = status
+
+class SessionRegistry:
+    """
+    Keeps one Trainer per session id and decides which of them may train.
+    All methods run on the eventlet hub (routes and socket handlers), so no locking is needed.
+    """
+    def __init__(self, max_sessions=MAX_SESSIONS, max_concurrent=MAX_CONCURRENT, threads_per_session=THREADS_PER_SESSION):
+        self.max_sessions = max_sessions
+        self.max_concurrent = max_concurrent
+        self.threads_per_session = threads_per_session
+        self._sessions = {}
+        self._last_used = {}
+        # Sessions that must not be evicted although they are not training (queued jobs)
+        self._pinned = set()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def running(self):
+        """Session ids that are currently training, or whose stopped loop is still exiting."""
+        return [sid for sid, trainer in self._sessions.items() if trainer.busy]
+
+    def get(self, session_id):
+        """Returns the Trainer of a session, or None if it does not exist."""
+        session_id = session_id or DEFAULT_SESSION_ID
+        trainer = self._sessions.get(session_id)
+        if trainer is None and session_id == DEFAULT_SESSION_ID and len(self._sessions) < self.max_sessions:
+            # Created on demand, but never at the expense of another user's session
+            trainer = self.create(DEFAULT_SESSION_ID)[1]
+        if trainer is not None:
+            self._last_used[session_id] = time.monotonic()
+        return trainer
+
+    def create(self, session_id=None):
+        """Creates a new session and returns (session_id, trainer)."""
+        if len(self._sessions) >= self.max_sessions:
+            self._evict_idle()
+        session_id = session_id or uuid.uuid4().hex[:12]
+        trainer = Trainer(session_id=session_id)
+        self._sessions[session_id] = trainer
+        self._last_used[session_id] = time.monotonic()
+        return session_id, trainer
+
+    def start(self, session_id, config):
+        """Starts training in a session, subject to the concurrency limit."""
+        trainer = self.get(session_id)
+        if trainer is None:
+            raise AdmissionError(f"Unknown model_id '{session_id}'", status=404)
+        if trainer.is_running:
+            raise AdmissionError("already_running", status=400)
+        # A stopped run may still be in the middle of a step: never run two loops on one trainer
+        if not trainer.join(STOP_TIMEOUT):
+            raise AdmissionError("The previous run is still stopping, try again in a moment", status=409)
+        if len(self.running()) >= self.max_concurrent:
+            raise AdmissionError(f"Server busy: {self.max_concurrent} trainings already running", status=503)
+        trainer.num_threads = self.threads_per_session
+        trainer.other_sessions_running = lambda: any(t.busy for t in list(self._sessions.values()) if t is not trainer)
+        trainer.start(config)
+        return trainer
+
+    def pin(self, session_id):
+        """Protects a session from eviction while it is idle, e.g. while its job waits in the queue."""
+        self._pinned.add(session_id or DEFAULT_SESSION_ID)
+
+    def unpin(self, session_id):
+        self._pinned.discard(session_id or DEFAULT_SESSION_ID)
+
+    def remove(self, session_id):
+        """Stops and forgets a session."""
+        trainer = self._sessions.pop(session_id, None)
+        self._last_used.pop(session_id, None)
+        self._pinned.discard(session_id)
+        if trainer is not None:
+            trainer.stop()
+
+    def _evict_idle(self):
+        """Drops the least recently used idle session to make room for a new one."""
+        idle = [sid for sid, trainer in self._sessions.items() if not trainer.busy and sid not in self._pinned]
+        if not idle:
+            raise AdmissionError(f"Server full: {self.max_sessions} active sessions", status=503)
+        self.remove(min(idle, key=lambda sid: self._last_used.get(sid, 0)))
+
+# Global registry shared by the API routes and socket handlers
+registry = SessionRegistry()
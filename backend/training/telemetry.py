@@ -0,0 +1,155 @@
+import base64
+import io
+import time
+import torch
+from PIL import Image
+
+# Default number of 'training_update' events per second for a session.
+DEFAULT_TELEMETRY_HZ = 5.0
+
+# Payload encodings for the sample fields of 'training_update'.
+# 'json': PNG data URL + list of floats (what the frontend has always consumed).
+# 'binary': raw arrays sent as Socket.IO binary attachments, see binary_frame().
+TELEMETRY_FORMATS = ("json", "binary")
+
+class TelemetryPublisher:
+    """
+    Decides when the training loop should send a 'training_update' and aggregates
+    every batch seen since the previous one.
+
+    Updates are paced by wall-clock time (rate_hz) instead of a fixed batch interval,
+    so a fast MLP does not flood the websocket and a slow ResNet still reports regularly.
+    The batches in between are not lost: their loss/accuracy are folded into
+    mean/min/max values that are sent with the next update.
+
+    Loss and correct counts can be passed as tensors on the training device. They are
+    accumulated there, without a host synchronization per batch, and copied to the host
+    in a single transfer by flush().
+    """
+    def __init__(self, rate_hz=DEFAULT_TELEMETRY_HZ, clock=time.monotonic):
+        self.rate_hz = max(0.1, float(rate_hz))
+        self.interval = 1.0 / self.rate_hz
+        self.clock = clock
+        self._last_emit = None
+        self._window_start = clock()
+        self._reset()
+
+    def _reset(self):
+        self._batches = 0
+        self._samples = 0
+        # Running [loss, correct, accuracy] sums / minimums / maximums, on the device of the inputs
+        self._sum = None
+        self._min = None
+        self._max = None
+
+    def record(self, loss, correct, count):
+        """Adds the results of one training batch (mean loss, number correct, batch size) to the current window."""
+        device = loss.device if torch.is_tensor(loss) else None
+        loss = torch.as_tensor(loss, dtype=torch.float32, device=device).detach().float()
+        correct = torch.as_tensor(correct, device=device).detach().float()
+        values = torch.stack([loss, correct, correct * (100. / count)])
+        if self._sum is None:
+            self._sum, self._min, self._max = values, values, values
+        else:
+            self._sum = self._sum + values
+            self._min = torch.minimum(self._min, values)
+            self._max = torch.maximum(self._max, values)
+        self._batches += 1
+        self._samples += count
+
+    def due(self):
+        """True when the time budget allows another update (always true for the first one)."""
+        return self._last_emit is None or self.clock() - self._last_emit >= self.interval
+
+    def flush(self):
+        """
+        Closes the current window and returns its aggregated metrics.
+        'loss' and 'accuracy' are window means, so they stay comparable whatever the rate.
+        'samples_per_sec' is the training throughput since the previous flush.
+        """
+        now = self.clock()
+        window_seconds = now - self._window_start
+        self._last_emit = self._window_start = now
+        if self._batches == 0:
+            return {}
+        # The only host synchronization of the window
+        (loss_sum, correct, _), (loss_min, _, acc_min), (loss_max, _, acc_max) = \
+            torch.stack([self._sum, self._min, self._max]).cpu().tolist()
+        stats = {
+            "loss": loss_sum / self._batches,
+            "loss_min": loss_min,
+            "loss_max": loss_max,
+            "accuracy": 100. * correct / self._samples,
+            "accuracy_min": acc_min,
+            "accuracy_max": acc_max,
+            "batches_aggregated": self._batches,
+            "samples_per_sec": self._samples / window_seconds if window_seconds > 0 else 0.0,
+        }
+        self._reset()
+        return stats
+
+def layer_statistics(named_params, previous=None):
+    """
+    Per-layer norms for the weights panel, computed with batched foreach reductions and
+    copied to the host in one transfer:
+      - weights:       ||w||
+      - grad_norms:    ||grad w|| (0 for parameters without a gradient)
+      - update_ratios: ||w - w_prev|| / ||w||, the relative size of the last optimizer step,
+                       when the weights from before that step are given in `previous`
+    """
+    names = [name for name, _ in named_params]
+    params = [param.detach() for _, param in named_params]
+    if not params:
+        return {"weights": {}, "grad_norms": {}, "update_ratios": {}}
+    with torch.no_grad():
+        weight_norms = torch.stack(torch._foreach_norm(params))
+        grads = [p.grad if p.grad is not None else torch.zeros_like(p) for _, p in named_params]
+        grad_norms = torch.stack(torch._foreach_norm(grads))
+        rows = [weight_norms, grad_norms]
+        if previous is not None:
+            update_norms = torch.stack(torch._foreach_norm(torch._foreach_sub(params, previous)))
+            rows.append(update_norms / weight_norms.clamp_min(1e-12))
+        values = torch.stack(rows).cpu().tolist()
+    stats = {
+        "weights": dict(zip(names, values[0])),
+        "grad_norms": dict(zip(names, values[1])),
+        "update_ratios": {},
+    }
+    if previous is not None:
+        stats["update_ratios"] = dict(zip(names, values[2]))
+    return stats
+
+def binary_frame(tensor):
+    """
+    Packs a CPU tensor as {shape, dtype, data} where data is the raw little-endian buffer.
+    python-socketio ships bytes values as binary attachments, so there is no base64 step.
+    """
+    tensor = tensor.detach().contiguous()
+    return {
+        "shape": list(tensor.shape),
+        "dtype": str(tensor.dtype).replace("torch.", ""),
+        "data": tensor.numpy().tobytes(),
+    }
+
+def encode_sample_input(img_tensor, fmt="json"):
+    """
+    Turns a normalized input image [1, H, W] into something the frontend can display.
+    Pixels are min-max scaled to 0-255 first, so any dataset normalization looks the same.
+    """
+    img = img_tensor.detach().cpu().float().squeeze()
+    img_min, img_max = img.min(), img.max()
+    pixels = ((img - img_min) / (img_max - img_min + 1e-5) * 255).to(torch.uint8)
+    if fmt == "binary":
+        return binary_frame(pixels)
+
+    img_pil = Image.fromarray(pixels.numpy(), mode='L')
+    buffered = io.BytesIO()
+    img_pil.save(buffered, format="PNG")
+    return f"data:image/png;base64,{base64.b64encode(buffered.getvalue()).decode('utf-8')}"
+
+def encode_sample_output(probs, fmt="json"):
+    """Encodes the class probabilities of the sample as a float list or a float32 frame."""
+    probs = probs.detach().cpu().float()
+    if fmt == "binary":
+        return binary_frame(probs)
+    return probs.tolist()
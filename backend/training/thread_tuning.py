@@ -0,0 +1,122 @@
+"""
+Intra-op thread calibration for CPU training.
+
+PyTorch uses every core by default, which is the wrong choice for the small models of this
+project: for the ~100k-parameter SimpleMLP the cost of synchronizing threads is higher than
+the math they share. Before a CPU training starts, a few forward/backward steps of the
+selected architecture and batch size are timed at several thread counts and the fastest
+count is kept.
+
+Results are cached per host (in memory and in a small JSON file, NNTV_THREAD_CACHE), so each
+(architecture, batch size) pair is only measured once per machine. Measurements taken while
+other sessions train on the same cores are used once but not cached (persist=False).
+"""
+import json
+import os
+import platform
+import time
+import torch
+import torch.nn.functional as F
+from .architectures import get_architecture
+from .datasets import IMAGE_SIZE
+
+CACHE_PATH = os.environ.get('NNTV_THREAD_CACHE', os.path.join('.', 'data', 'thread_calibration.json'))
+
+# Timed steps per candidate thread count, after WARMUP_STEPS untimed ones.
+WARMUP_STEPS = 2
+TIMED_STEPS = 5
+
+# (host key, architecture, batch_size) -> thread count
+_CALIBRATION = {}
+
+def _host_key():
+    """Identifies the machine and the PyTorch build the measurements are valid for."""
+    return f"{platform.node()}|{os.cpu_count()}|torch-{torch.__version__}"
+
+def _load_cache():
+    try:
+        with open(CACHE_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_cache(entries):
+    try:
+        os.makedirs(os.path.dirname(CACHE_PATH) or '.', exist_ok=True)
+        with open(CACHE_PATH, 'w') as f:
+            json.dump(entries, f, indent=2, sort_keys=True)
+    except OSError as e:
+        # Calibrating again next time is the only cost
+        print(f"Could not save thread calibration: {e}")
+
+def candidate_thread_counts(limit):
+    """1, 2, 4, ... up to `limit`, always including `limit` itself."""
+    counts = []
+    n = 1
+    while n < limit:
+        counts.append(n)
+        n *= 2
+    counts.append(max(1, limit))
+    return counts
+
+def benchmark_threads(architecture, batch_size, num_threads, should_stop=None):
+    """
+    Average seconds of one forward/backward step at `num_threads` intra-op threads,
+    or None if should_stop() turned true between two steps.
+    """
+    model = get_architecture(architecture)
+    model.train()
+    data = torch.randn(batch_size, 1, *IMAGE_SIZE)
+    target = torch.randint(0, 10, (batch_size,))
+
+    previous = torch.get_num_threads()
+    torch.set_num_threads(num_threads)
+    try:
+        for step in range(WARMUP_STEPS + TIMED_STEPS):
+            if should_stop and should_stop():
+                return None
+            if step == WARMUP_STEPS:
+                start = time.perf_counter()
+            model.zero_grad(set_to_none=True)
+            F.cross_entropy(model(data), target).backward()
+        return (time.perf_counter() - start) / TIMED_STEPS
+    finally:
+        torch.set_num_threads(previous)
+
+def calibrate_threads(architecture, batch_size, limit=None, persist=True, should_stop=None):
+    """
+    Returns (thread count, source) for CPU training of `architecture` at `batch_size`,
+    never more than `limit` threads (defaults to the core count).
+    source is 'cached' when a previous measurement was reused, 'calibrated' otherwise,
+    'calibrated, not cached' when persist=False (a noisy measurement that must not be reused).
+    should_stop is polled between benchmark steps; once it returns true the measurement is
+    abandoned and (None, 'interrupted') is returned.
+    """
+    limit = max(1, int(limit or os.cpu_count() or 1))
+    candidates = candidate_thread_counts(limit)
+    if len(candidates) == 1:
+        return candidates[0], 'calibrated'
+
+    host = _host_key()
+    key = f"{architecture}:{int(batch_size)}:{limit}"
+    if (host, key) in _CALIBRATION:
+        return _CALIBRATION[host, key], 'cached'
+    entries = _load_cache()
+    if key in entries.get(host, {}):
+        _CALIBRATION[host, key] = entries[host][key]
+        return _CALIBRATION[host, key], 'cached'
+
+    timings = {}
+    for n in candidates:
+        timings[n] = benchmark_threads(architecture, batch_size, n, should_stop)
+        if timings[n] is None:
+            return None, 'interrupted'
+    best = min(timings, key=timings.get)
+    print(f"Thread calibration for {key}: " + ", ".join(f"{n}={t * 1000:.1f}ms" for n, t in timings.items()))
+    if not persist:
+        return best, 'calibrated, not cached'
+
+    _CALIBRATION[host, key] = best
+    entries.setdefault(host, {})[key] = best
+    _save_cache(entries)
+    return best, 'calibrated'
@@ -3,26 +3,107 @@ import torch.nn as nn
 import torch.optim as optim
 import time
 import eventlet
-import base64
-import io
+import json
 import os
 import traceback
-from PIL import Image
+import uuid
+import zlib
+from eventlet import patcher, tpool
 from backend.extensions import socketio
 from .architectures import get_architecture
-from .datasets import get_dataloader
+from .datasets import describe_loader, get_dataloader, resolve_loader_profile
+from backend.utils.heatmap import apply_view
+from backend.utils.weight_codec import encode_weights
+from .batching import AdaptiveBatchSize, MicroBatcher, DEFAULT_TARGET_STEP_MS
+from .activations import ActivationCapture, capture_activations
+from .compilation import CompiledModel, resolve_compile_mode
+from .inference import InferenceSnapshot, PredictionBatcher, run_snapshot, DEFAULT_SNAPSHOT_EVERY, MAX_PREDICT_BATCH
+from .memory_format import resolve_memory_format, to_memory_format
+from .thread_tuning import calibrate_threads
+from .telemetry import TelemetryPublisher, DEFAULT_TELEMETRY_HZ, TELEMETRY_FORMATS, encode_sample_input, encode_sample_output, layer_statistics
+
+# Unpatched stdlib modules. eventlet.monkey_patch() turns 'threading' and 'queue' into
+# green versions, but the training worker must be a real OS thread so PyTorch can run
+# its kernels (which release the GIL) without starving the eventlet hub.
+_native_threading = patcher.original('threading')
+_native_queue = patcher.original('queue')
+
+# How often the hub drains events queued by the worker thread (seconds).
+EVENT_PUMP_INTERVAL = 0.02
+
+# How often join() checks whether a stopped run's loop has exited (seconds).
+JOIN_POLL_INTERVAL = 0.05
+
+# Maximum number of serialized weight snapshots kept per trainer.
+SNAPSHOT_CACHE_SIZE = 32
+
+# 'precision' config option -> autocast dtype of the forward pass (None = plain float32).
+PRECISIONS = {"fp32": None, "bf16": torch.bfloat16}
+
+def session_room(session_id):
+    """Socket.IO room of a session; clients join it via the 'join_session' event."""
+    return f"session:{session_id}"
 
 class Trainer:
     """
     The Trainer class orchestrates the entire lifecycle of the neural network training.
     It handles data loading, model initialization, the training loop, and real-time metric emission.
     """
-    def __init__(self):
+    def __init__(self, session_id="default"):
+        # Identifies the session (model_id) this trainer belongs to, see sessions.py
+        self.session_id = session_id
+        # PyTorch intra-op threads for this session's loop (None = PyTorch default)
+        self.num_threads = None
+        # Set by the registry: returns True while other sessions train on this host, when
+        # thread calibration measures contended cores and must not cache the result
+        self.other_sessions_running = None
+        # Micro-batch size the thread count was calibrated for; reset once the loop has checked
+        # it against the size an adaptive controller settled on
+        self._calibrated_batch = None
+        self._thread_limit = None
+        self.batch_controller = None
+        self.accumulation_steps = 1
+        self.precision = 'fp32'
         self.model = None
+        # CompiledModel running self.model's forward when the 'compile' option is on
+        self.compiled_model = None
+        # Layout of parameters and input batches ('memory_format' option)
+        self.memory_format = torch.contiguous_format
+        # Frozen eval copy of the model that predict() runs on, see inference.py
+        self.inference_snapshot = None
+        self._inference_requested = False
+        # Merges concurrent predict() calls into one forward pass over the snapshot
+        self.prediction_batcher = PredictionBatcher(self._current_inference_snapshot)
         self.optimizer = None
         self.criterion = nn.CrossEntropyLoss()
+        # True from start() until stop() or the end of the run. The loop itself only watches
+        # its own run's stop event, so a restart can never revive a loop that was stopped.
         self.is_running = False
+        self._stop_event = None
+        # Loop of the last run: a native Thread ('thread' mode) or a GreenThread ('green' mode)
+        self._worker = None
         self.config = {}
+        # 'thread': run the loop in a native worker thread and relay events through a queue.
+        # 'green': legacy mode, run the loop as an eventlet green thread on the server hub.
+        self.worker_mode = 'thread'
+        self._events = _native_queue.Queue()
+        # Latest 'training_update' not yet sent by the hub. Newer frames replace it, so a busy
+        # or backpressured hub only ever sends the freshest state instead of a backlog.
+        self._pending_update = None
+        self._update_lock = _native_threading.Lock()
+        self.dropped_updates = 0
+        # Weight versioning: 'generation' changes with every new model, 'step' with every optimizer step.
+        # Together they identify a weight state, which lets /api/weights answer 304 Not Modified.
+        self.generation = 0
+        # Distinguishes this Trainer's ETags from those of an earlier one with the same id
+        # (server restart, evicted and recreated session), whose generations also started at 0
+        self.instance_token = uuid.uuid4().hex[:8]
+        self.step = 0
+        # Fraction of the requested epochs done, and when the run started (used for queue ETAs)
+        self.progress = 0.0
+        self.started_at = None
+        self._snapshot_cache = {}
+        self._snapshot_lock = _native_threading.Lock()
         # Automatically detect if we have a GPU available (CUDA) or default to CPU
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
@@ -30,12 +111,28 @@ class Trainer:
         """
         Initializes the model and kicks off the training process in a background thread.
         This prevents blocking the main Flask application so the UI remains responsive.
+        Refuses to start while the loop of a previous run is still exiting (see join()).
         """
+        if self.is_running or self.worker_alive():
+            raise RuntimeError("The previous run of this session has not stopped yet")
         self.config = config
         self.is_running = True
+        stop_event = self._stop_event = _native_threading.Event()
+        self.generation += 1
+        self.step = 0
+        self.progress = 0.0
+        self.started_at = time.time()
+        self.worker_mode = config.get('worker', 'thread')
         
         # Instantiate the requested model architecture (e.g., MLP, LeNet, ResNet)
-        self.model = get_architecture(config.get('architecture', 'mlp')).to(self.device)
+        self.memory_format = resolve_memory_format(config.get('memory_format'))
+        self.model = get_architecture(config.get('architecture', 'mlp')).to(self.device, memory_format=self.memory_format)
+        # Published before the loop exists, so predict() never has to copy a model that is training
+        self.publish_inference_snapshot()
+        compile_mode = resolve_compile_mode(config.get('compile', 'off'))
+        self.compiled_model = None
+        if compile_mode != 'off':
+            self.compiled_model = CompiledModel(self.model, config.get('architecture', 'mlp'), compile_mode, log=self._log)
         self.optimizer = optim.Adam(self.model.parameters(), lr=config.get('lr', 0.001))
         
         # Prepare the dataset loader
@@ -48,15 +145,50 @@ class Trainer:
              print("Auto-scaling batch size to 128 for ResNet on GPU")
              batch_size = 128
         
-        # OPTIMIZATION: If on CPU and using heavy ResNet, reduce batch size to prevent UI freeze
-        # ResNet-18 on unoptimized CPU is painfully slow. batch_size=1 ensures we yield control frequently.
-        if self.device.type == 'cpu' and config.get('architecture') == 'resnet':
-            print("Auto-optimizing batch size for CPU ResNet")
-            batch_size = 2 # BatchNorm requires > 1 sample. 2 is the minimum safe value.
-            
-        train_loader = get_dataloader(dataset_name, batch_size=batch_size, train=True)
+        # On CPU, a full forward/backward of a heavy model (ResNet-18) can take seconds.
+        # Rather than shrinking the batch, split it into micro-batches (a fixed 'micro_batch_size',
+        # or sized to a latency target); gradients are accumulated, so the optimizer still sees
+        # the requested batch size.
+        self.batch_controller = None
+        if config.get('micro_batch_size'):
+            self.batch_controller = MicroBatcher(min(int(config['micro_batch_size']), int(batch_size)))
+        elif config.get('adaptive_batch', self.device.type == 'cpu' and compile_mode == 'off'):
+            # (off by default for compiled models: every new micro-batch size is a new graph to compile)
+            self.batch_controller = AdaptiveBatchSize(batch_size, config.get('target_step_ms', DEFAULT_TARGET_STEP_MS))
+        # Gradient accumulation across batches: one optimizer step every N batches
+        self.accumulation_steps = max(1, int(config.get('accumulation_steps', 1)))
+
+        # Mixed precision: bfloat16 autocast for the forward pass, weights and loss stay float32
+        self.precision = config.get('precision', 'fp32')
+        if self.precision not in PRECISIONS:
+            self.precision = 'fp32'
+
+        # Workers / prefetching / pinned memory. Green mode shares the hub, so no prefetch thread there.
+        loader_profile = resolve_loader_profile(config.get('loader'), self.device, threaded=self.worker_mode != 'green')
+        cache_dataset = config.get('cache_dataset', True)
+        train_loader = get_dataloader(dataset_name, batch_size=batch_size, train=True,
+                                      cache=cache_dataset, device=self.device,
+                                      profile=loader_profile)
         epochs = config.get('epochs', 10)
 
+        # CPU: use the intra-op thread count that is fastest for this model and the size of the
+        # forward/backward passes the loop runs (the micro-batch size when micro-batching), within
+        # the per-session budget set by the registry (self.num_threads). An adaptive micro-batch
+        # size is only known once it settles; the loop calibrates again then (_recalibrate_threads).
+        thread_source = None
+        self._thread_limit = self.num_threads
+        self._calibrated_batch = None
+        if self.device.type == 'cpu':
+            if config.get('threads'):
+                self.num_threads = min(int(config['threads']), self.num_threads or os.cpu_count() or 1)
+                thread_source = 'config'
+            else:
+                self._calibrated_batch = self.batch_controller.size if self.batch_controller else int(batch_size)
+                # Run off the hub: the first measurement on a host takes a moment
+                self.num_threads, thread_source = tpool.execute(calibrate_threads, config.get('architecture', 'mlp'),
+                                                                self._calibrated_batch, self.num_threads,
+                                                                not self._host_shared())
+
         print(f"Starting training: {config} on {self.device}")
         
         # Detailed Device Diagnostics for User
@@ -65,133 +197,303 @@ class Trainer:
              device_msg += f" ({torch.cuda.get_device_name(0)})"
         else:
              device_msg += f" (Note: GPU not detected. Ensure CUDA is installed.)"
+             device_msg += f" | {self.num_threads} CPU threads ({thread_source})"
              
-        socketio.emit('log', {'time': time.strftime('%H:%M:%S'), 'message': device_msg})
-        if self.device.type == 'cpu':
-             socketio.emit('log', {'time': time.strftime('%H:%M:%S'), 'message': f"⚠️ ResNet on CPU is slow. Reduced batch size to {batch_size} for responsiveness."})
+        self._broadcast('log', {'time': time.strftime('%H:%M:%S'), 'message': device_msg})
+        self._broadcast('log', {'time': time.strftime('%H:%M:%S'), 'message': f"📦 Data loader: {describe_loader(loader_profile, cache_dataset)}"})
+        if isinstance(self.batch_controller, AdaptiveBatchSize):
+             self._broadcast('log', {'time': time.strftime('%H:%M:%S'), 'message': f"⚙️ Adaptive micro-batches: batch {batch_size} is split to keep each step "
+                                                                              f"under {self.batch_controller.target * 1000:.0f} ms"})
+        elif self.batch_controller is not None:
+             self._broadcast('log', {'time': time.strftime('%H:%M:%S'), 'message': f"⚙️ Micro-batches: batch {batch_size} is split into {self.batch_controller.size}-sample steps"})
+        if self.memory_format is torch.channels_last:
+             self._broadcast('log', {'time': time.strftime('%H:%M:%S'), 'message': "⚙️ Memory format: channels_last (NHWC)"})
+        if self.precision == 'bf16':
+             native = self.device.type != 'cpu' or torch.ops.mkldnn._is_mkldnn_bf16_supported()
+             self._broadcast('log', {'time': time.strftime('%H:%M:%S'), 'message': "⚙️ Precision: bfloat16 autocast" +
+                                     ("" if native else " (⚠️ no native bf16 support on this CPU, expect it to be slower)")})
+        if self.accumulation_steps > 1:
+             self._broadcast('log', {'time': time.strftime('%H:%M:%S'), 'message': f"⚙️ Gradient accumulation: {self.accumulation_steps} batches per optimizer step "
+                                                                              f"(effective batch {batch_size * self.accumulation_steps})"})
         
-        # Start the heavy lifting in a background task managed by Socket.IO/Eventlet
-        socketio.start_background_task(self._training_loop, train_loader, epochs)
+        if self.worker_mode == 'green':
+            # Start the heavy lifting in a green thread on the Socket.IO/Eventlet hub
+            self._worker = eventlet.spawn(self._training_loop, train_loader, epochs, stop_event, None)
+            return
+
+        # Run the loop on a real OS thread; the hub only relays the events it produces.
+        events = self._events = _native_queue.Queue()
+        self._worker = _native_threading.Thread(target=self._training_loop, args=(train_loader, epochs, stop_event, events),
+                                                name="nntv-trainer", daemon=True)
+        self._worker.start()
+        socketio.start_background_task(self._pump_events, events)
 
     def stop(self):
         """
         Signals the training loop to terminate gracefully at the next available check.
+        The loop may still be finishing its current step when this returns, see join().
         """
         self.is_running = False
+        if self._stop_event is not None:
+            self._stop_event.set()
         print("Stopping training")
 
-    def _training_loop(self, train_loader, epochs):
+    def worker_alive(self):
+        """True until the loop of the last run has exited, including after stop()."""
+        worker = self._worker
+        if worker is None:
+            return False
+        if isinstance(worker, _native_threading.Thread):
+            return worker.is_alive()
+        return not worker.dead
+
+    @property
+    def busy(self):
+        """True while a run is active or its loop is still exiting: the session holds a training slot."""
+        return self.is_running or self.worker_alive()
+
+    def join(self, timeout):
+        """
+        Waits up to `timeout` seconds for the loop of the last run to exit. Runs on the hub,
+        so it polls instead of blocking in Thread.join. Returns True once it has exited.
+        """
+        deadline = time.monotonic() + timeout
+        while self.worker_alive():
+            if time.monotonic() >= deadline:
+                return False
+            socketio.sleep(JOIN_POLL_INTERVAL)
+        return True
+
+    def _emit(self, event, payload):
+        """
+        Sends a Socket.IO event from the training loop.
+        In thread mode the worker must never touch the eventlet hub, so events are queued
+        and emitted by _pump_events on the server side instead.
+        """
+        if self.worker_mode == 'green':
+            self._broadcast(event, payload)
+        elif event == 'training_update':
+            with self._update_lock:
+                if self._pending_update is not None:
+                    self.dropped_updates += 1
+                self._pending_update = payload
+        else:
+            self._events.put((event, payload))
+
+    def _log(self, message):
+        """Shortcut for the timestamped 'log' event shown in the frontend console."""
+        self._emit('log', {'time': time.strftime('%H:%M:%S'), 'message': message})
+
+    def _yield(self):
+        """Gives the eventlet hub a chance to run. Only needed when the loop shares the hub."""
+        if self.worker_mode == 'green':
+            eventlet.sleep(0)
+
+    def _pump_events(self, events):
+        """
+        Green background task that forwards events queued by the worker thread to Socket.IO.
+        Exits once the worker has sent 'training_complete'.
+        """
+        while True:
+            while True:
+                try:
+                    event, payload = events.get_nowait()
+                except _native_queue.Empty:
+                    break
+                if event == 'training_complete':
+                    # Deliver the final metrics before announcing completion
+                    self._send_pending_update()
+                    self._broadcast(event, payload)
+                    return
+                self._broadcast(event, payload)
+            self._send_pending_update()
+            socketio.sleep(EVENT_PUMP_INTERVAL)
+
+    def _send_pending_update(self):
+        """Emits the most recent coalesced 'training_update', if any. Runs on the hub."""
+        with self._update_lock:
+            payload, self._pending_update = self._pending_update, None
+        if payload is not None:
+            self._broadcast('training_update', payload)
+
+    @property
+    def room(self):
+        """Socket.IO room of this session, see session_room()."""
+        return session_room(self.session_id)
+
+    def _broadcast(self, event, payload):
+        """
+        Hub-side emit of a session event, delivered only to the clients in the session's room.
+        Payloads are also tagged with the model_id.
+        """
+        socketio.emit(event, dict(payload, model_id=self.session_id), to=self.room)
+
+    def _training_loop(self, train_loader, epochs, stop_event, events):
         """
         The core training logic. It iterates through epochs and batches, performing forward/backward passes.
         Crucially, it captures intermediate states (activations, inputs) to send to the frontend for visualization.
+        `stop_event` and `events` (the event queue, None in green mode) belong to this run only.
         """
-        total_batches = len(train_loader)
-        start_time = time.time()
+        capture = None
+        try:
+            # Setup is inside the try too: a bad option (e.g. telemetry_hz) must still end the run
+            # through the finally below, or the session would look busy forever
+            total_batches = len(train_loader)
+            start_time = time.time()
+            publisher = TelemetryPublisher(self.config.get('telemetry_hz', DEFAULT_TELEMETRY_HZ))
+            telemetry_format = self.config.get('telemetry_format', 'json')
+            if telemetry_format not in TELEMETRY_FORMATS:
+                telemetry_format = 'json'
+            self._pending_update = None
+            self.dropped_updates = 0
+            autocast_dtype = PRECISIONS[self.precision]
         
-        socketio.emit('log', {'time': time.strftime('%H:%M:%S'), 'message': f"DEBUG: Starting loop. Epochs: {epochs}, Batches: {total_batches}"})
+            self._log(f"DEBUG: Starting loop. Epochs: {epochs}, Batches: {total_batches}")
+            if self.num_threads:
+                # Per-session CPU budget. Called from the loop's own thread so it applies to its kernels.
+                torch.set_num_threads(self.num_threads)
 
-        hooks = []
-        try:
             # --- Visualization Hooks Setup ---
             # We need to peek inside the "black box" of the neural network.
-            activations = {}
-            def get_activation(name):
-                def hook(model, input, output):
-                    activations[name] = output.detach().cpu()
-                return hook
-
-            if self.model:
-                for name, layer in self.model.named_modules():
-                    # We mainly care about Linear (Full Connected) and Conv2d layers for the visual flow
-                    if isinstance(layer, (nn.Linear, nn.Conv2d)):
-                        hooks.append(layer.register_forward_hook(get_activation(name)))
+            # The hooks only record while armed, i.e. during the forward pass of a reported batch.
+            # Compiled models do not run submodule hooks; they use an eager probe pass instead (see below).
+            if self.model and self.compiled_model is None:
+                capture = ActivationCapture(self.model)
+
+            forward = self.compiled_model or self.model
+            # Parameters shown in the weights panel
+            weight_params = [(name, param) for name, param in self.model.named_parameters() if 'weight' in name]
+
+            # predict() reads a frozen copy of the model (first published by start()), refreshed
+            # every few optimizer steps
+            snapshot_every = max(1, int(self.config.get('snapshot_every', DEFAULT_SNAPSHOT_EVERY)))
 
             # --- Main Loop ---
             for epoch in range(1, epochs + 1):
-                socketio.emit('log', {'time': time.strftime('%H:%M:%S'), 'message': f"DEBUG: Starting Epoch {epoch}"})
+                self._log(f"DEBUG: Starting Epoch {epoch}")
                 
-                if not self.is_running:
-                    socketio.emit('log', {'time': time.strftime('%H:%M:%S'), 'message': "DEBUG: Loop stopped by flag (outer)"})
+                if stop_event.is_set():
+                    self._log("DEBUG: Loop stopped by flag (outer)")
                     break
                     
                 for batch_idx, (data, target) in enumerate(train_loader):
                     if batch_idx == 0:
-                        socketio.emit('log', {'time': time.strftime('%H:%M:%S'), 'message': f"DEBUG: Processing first batch of epoch {epoch}"})
+                        self._log(f"DEBUG: Processing first batch of epoch {epoch}")
                     
                     # Check for stop signal inside the batch loop for faster response
-                    if not self.is_running:
-                        socketio.emit('log', {'time': time.strftime('%H:%M:%S'), 'message': "DEBUG: Loop stopped by flag (inner)"})
+                    if stop_event.is_set():
+                        self._log("DEBUG: Loop stopped by flag (inner)")
                         break
                 
                     # Move data to the active device (GPU or CPU)
                     data, target = data.to(self.device), target.to(self.device)
-                    self.optimizer.zero_grad()
-                    
-                    # 1. Forward Pass: Compute predictions
-                    output = self.model(data)
-                    
-                    if not self.is_running: break
-                    eventlet.sleep(0) # Yield to network thread to catch stop signal
+                    data = to_memory_format(data, self.memory_format)
 
-                    # 2. Calculate Loss: How wrong were we?
-                    loss = self.criterion(output, target)
-                    
-                    if not self.is_running: break
-                    eventlet.sleep(0)
+                    # Gradient accumulation: batches are grouped by accumulation_steps, and every batch
+                    # of a group contributes 1/group_size of the gradient (the last group of an epoch
+                    # may be shorter).
+                    group_start = batch_idx - batch_idx % self.accumulation_steps
+                    group_size = min(self.accumulation_steps, total_batches - group_start)
+                    if batch_idx == group_start:
+                        self.optimizer.zero_grad()
 
-                    # 3. Backward Pass: Calculate gradients (Backpropagation)
-                    loss.backward()
-                    
-                    if not self.is_running: break
-                    eventlet.sleep(0)
+                    # Forward/backward one micro-batch at a time (a single one unless micro-batching is on).
+                    # Their gradients add up to the gradient of the whole batch.
+                    sizes = self.batch_controller.split(len(data)) if self.batch_controller else [len(data)]
+                    batch_loss = 0.0
+                    correct = 0
+                    # Decided up front, so the activation hooks only record for batches that are sent.
+                    # The last batch of an epoch always reports, so every epoch ends on fresh numbers.
+                    report = publisher.due() or batch_idx == total_batches - 1
+                    for chunk_idx, (chunk_data, chunk_target) in enumerate(zip(data.split(sizes), target.split(sizes))):
+                        chunk_start = time.perf_counter()
+                        if capture is not None:
+                            # The sample shown is the first one of the last micro-batch
+                            capture.armed = report and chunk_idx == len(sizes) - 1
+
+                        # 1. Forward Pass: Compute predictions (autocast to bf16 when enabled)
+                        with torch.autocast(device_type=self.device.type, dtype=autocast_dtype or torch.float32,
+                                            enabled=autocast_dtype is not None):
+                            output = forward(chunk_data)
+
+                        if stop_event.is_set(): break
+                        self._yield() # Yield to network thread to catch stop signal
+
+                        # 2. Calculate Loss: How wrong were we? (weighted by this micro-batch's share)
+                        # Computed in float32 outside autocast, whatever the forward precision
+                        loss = self.criterion(output.float(), chunk_target) * (len(chunk_data) / len(data))
+
+                        if stop_event.is_set(): break
+                        self._yield()
+
+                        # 3. Backward Pass: Calculate gradients (Backpropagation), accumulated over the group
+                        (loss / group_size).backward()
 
-                    # 4. Optimization: Update weights using gradients
-                    self.optimizer.step()
+                        if stop_event.is_set(): break
+                        self._yield()
+
+                        if self.batch_controller and not getattr(forward, 'compiled_last_call', False):
+                            self.batch_controller.observe(len(chunk_data), time.perf_counter() - chunk_start)
+                        # Kept as device tensors: the publisher accumulates them without a host sync
+                        batch_loss += loss.detach()
+                        with torch.no_grad():
+                            correct += output.argmax(dim=1).eq(chunk_target).sum()
+
+                    if stop_event.is_set(): break
+
+                    if (self._calibrated_batch is not None and isinstance(self.batch_controller, AdaptiveBatchSize)
+                            and self.batch_controller.settled):
+                        self._recalibrate_threads(stop_event)
+
+                    # 4. Optimization: Update weights using gradients, once the group is complete
+                    previous_weights = None
+                    if batch_idx - group_start == group_size - 1:
+                        if report:
+                            # Pre-step copy, for the update-to-weight ratios of this update
+                            previous_weights = [param.detach().clone() for _, param in weight_params]
+                        self.optimizer.step()
+                        self.step += 1
+                        if self.step % snapshot_every == 0:
+                            self._inference_requested = True
+                    if self._inference_requested:
+                        # Between steps, so the copy is consistent
+                        self.publish_inference_snapshot()
+                    self.progress = ((epoch - 1) * total_batches + batch_idx + 1) / (epochs * total_batches)
                 
                 # --- Real-time Updates ---
-                    # We don't want to flood the websocket, so we emit updates every 10 batches.
-                    if batch_idx % 10 == 0:
-                        pred = output.argmax(dim=1, keepdim=True)
-                        correct = pred.eq(target.view_as(pred)).sum().item()
-                        accuracy = 100. * correct / len(data)
-                        
+                    # Every batch feeds the aggregated metrics; the publisher decides (by wall-clock
+                    # budget) whether this one also pays for a full update with visualizations.
+                    publisher.record(batch_loss, correct, len(data))
+
+                    if report:
+                        window = publisher.flush()
                         
-                        # Compute simplified weight norms for the "heatmap" awareness
+                        # Compute simplified weight norms for the "heatmap" awareness,
+                        # plus gradient norms and update ratios (batched reductions, one transfer)
+                        layer_stats = layer_statistics(weight_params, previous_weights)
+                        weights_data = layer_stats["weights"]
                         with torch.no_grad():
-                            weights_data = {}
-                            for name, param in self.model.named_parameters():
-                                if 'weight' in name:
-                                    weights_data[name] = param.norm().item()
-                                    
                             # --- Prepare Visualization Data ---
-                            # We take the FIRST sample from the current batch to show as a live example 
+                            # We take the FIRST sample of the last micro-batch (the one the hooks saw) as a live example
                             sample_img_data = None
                             sample_output = None
                             sample_activations = {}
                             
                             try:
-                                # Capture Input Image
-                                img_tensor = data[0].cpu().numpy()
-                                # normalize for display (min-max scaling to 0-255)
-                                img_min, img_max = img_tensor.min(), img_tensor.max()
-                                img_scaled = (img_tensor - img_min) / (img_max - img_min + 1e-5) * 255
-                                img_pil = Image.fromarray(img_scaled.squeeze().astype('uint8'), mode='L')
-                                buffered = io.BytesIO()
-                                img_pil.save(buffered, format="PNG")
-                                sample_img_data = f"data:image/png;base64,{base64.b64encode(buffered.getvalue()).decode('utf-8')}"
+                                # Capture Input Image (PNG data URL, or raw uint8 pixels in binary mode)
+                                sample_img_data = encode_sample_input(chunk_data[0], telemetry_format)
                                 
                                 # Capture Output Probabilities (Softmax)
                                 probs = torch.nn.functional.softmax(output[0], dim=0)
-                                sample_output = probs.detach().cpu().numpy().tolist()
+                                sample_output = encode_sample_output(probs, telemetry_format)
                             
                                 # Capture Layer Activations (Mean intensity)
                                 # This drives the "pulse" effect in the architecture diagram.
-                                sample_activations_raw = {}
-                                for name, act in activations.items():
-                                    if act.nelement() > 0:
-                                        sample_act = act[0]
-                                        sample_activations_raw[name] = float(sample_act.abs().mean())
-                                
+                                if capture is not None:
+                                    sample_activations_raw = capture.read()
+                                else:
+                                    sample_activations_raw = capture_activations(self.model, chunk_data[:1])
+
                                 # Re-map to short names for visual cleanliness
                                 sample_activations = {}
                                 for name, val in sample_activations_raw.items():
@@ -201,69 +503,220 @@ class Trainer:
                                     
                             except Exception as e:
                                 print(f"Error processing sample for viz: {e}")
-                                socketio.emit('log', {'time': time.strftime('%H:%M:%S'), 'message': f"Viz Error: {str(e)}"})
+                                self._log(f"Viz Error: {str(e)}")
 
                         elapsed = time.time() - start_time
                         metrics = {
                             "epoch": epoch,
                             "batch": batch_idx,
                             "total_batches": total_batches,
-                            "loss": loss.item(),
-                            "accuracy": accuracy,
+                            "loss": window["loss"],
+                            "accuracy": window["accuracy"],
                             "weights": weights_data,
+                            "grad_norms": layer_stats["grad_norms"],
+                            "update_ratios": layer_stats["update_ratios"],
                             "sample_input": sample_img_data,
                             "sample_output": sample_output,
                             "sample_activations": sample_activations,
                             "time_elapsed": elapsed,
-                            "eta": 0 
+                            "eta": 0,
+                            "loss_min": window["loss_min"],
+                            "loss_max": window["loss_max"],
+                            "accuracy_min": window["accuracy_min"],
+                            "accuracy_max": window["accuracy_max"],
+                            "batches_aggregated": window["batches_aggregated"],
+                            "batch_size": len(data),
+                            "micro_batch_size": self.batch_controller.size if self.batch_controller else len(data),
+                            "accumulation_steps": self.accumulation_steps,
+                            "effective_batch_size": len(data) * self.accumulation_steps,
+                            "samples_per_sec": window["samples_per_sec"],
+                            "precision": self.precision,
+                            "dropped_updates": self.dropped_updates,
+                            "format": telemetry_format
                         }
-                        socketio.emit('training_update', metrics)
+                        self._emit('training_update', metrics)
                     
                     # Yield control EVERY batch to prevent server freeze
-                    eventlet.sleep(0)
+                    self._yield()
 
             print(f"Epoch {epoch} complete")
-            socketio.emit('log', {'time': time.strftime('%H:%M:%S'), 'message': f"Epoch {epoch} complete"})
+            self._log(f"Epoch {epoch} complete")
             
         except BaseException as e:
             traceback.print_exc()
             print(f"Critical Training Error: {e}")
-            socketio.emit('log', {'time': time.strftime('%H:%M:%S'), 'message': f"CRITICAL: {str(e)}"})
-            socketio.emit('training_error', {"error": str(e)})
+            self._log(f"CRITICAL: {str(e)}")
+            self._emit('training_error', {"error": str(e)})
         finally:
             # Cleanup hooks to prevent memory leaks or duplicate logic if restarted
-            for h in hooks:
-                h.remove()
-                
-            self.is_running = False
-            socketio.emit('training_complete', {"status": "complete"})
+            if capture is not None:
+                capture.remove()
+
+            # Predictions after training use the final weights
+            try:
+                if self.model is not None:
+                    self.publish_inference_snapshot()
+            except Exception as e:
+                print(f"Could not publish the final inference snapshot: {e}")
+
+            # Only this run's state: its own queue and flag. start() refuses to begin a new run
+            # until this thread has exited, but a stopped run must not clear a newer one's flag.
+            if events is not None:
+                events.put(('training_complete', {"status": "complete"}))
+            else:
+                self._emit('training_complete', {"status": "complete"})
+            if self._stop_event is stop_event:
+                self.is_running = False
+
+    def _host_shared(self):
+        """True while other sessions train on this host (thread timings are then unreliable)."""
+        return bool(self.other_sessions_running and self.other_sessions_running())
+
+    def _recalibrate_threads(self, stop_event):
+        """
+        Calibrates the thread count again for the micro-batch size an AdaptiveBatchSize settled on,
+        once per run. Runs in the loop's thread, between steps, and applies the result there.
+        The measurement checks stop_event after every benchmark step, so a stop request is still
+        noticed within about one step.
+        """
+        size = self.batch_controller.size
+        calibrated, self._calibrated_batch = self._calibrated_batch, None
+        if size == calibrated:
+            return
+        threads, source = calibrate_threads(self.config.get('architecture', 'mlp'), size, self._thread_limit,
+                                            not self._host_shared(), stop_event.is_set)
+        if threads is None:
+            return
+        if threads != self.num_threads:
+            self.num_threads = threads
+            torch.set_num_threads(threads)
+        self._log(f"⚙️ Micro-batches settled at {size} samples: {threads} CPU threads ({source})")
+
+    def _weight_matrices(self, layer_name=None):
+        """
+        Yields (name, tensor) pairs in the heatmap layout, still on the training device.
+        A specific layer if layer_name is given, otherwise every 'weight' parameter.
+        """
+        for name, param in self.model.named_parameters():
+            if (layer_name and name == layer_name) or (not layer_name and 'weight' in name):
+                # Flatten if > 2D (e.g. Conv2d [Out, In, H, W] -> [Out, In*H*W] for 2D visualization)
+                data = param.detach()
+                if data.dim() > 2:
+                    data = data.reshape(data.size(0), -1)
+                yield name, data
 
-    def get_weights(self, layer_name=None):
-        """Retrieve raw weights for heatmap visualization."""
-        if not self.model: return {}
+    def get_layer_tensor(self, layer_name, view=None):
+        """
+        Returns (tensor, meta) for one layer in the heatmap layout, with the optional view applied,
+        or (None, None) if there is no model or no such layer. The tensor stays on the training device.
+        """
+        if not self.model:
+            return None, None
         with torch.no_grad():
-            if layer_name:
-                for name, param in self.model.named_parameters():
-                    if name == layer_name:
-                        # Flatten if > 2D (e.g. Conv2d [Out, In, H, W] -> [Out, In*H*W] for 2D visualization)
-                        data = param
-                        if data.dim() > 2:
-                             data = data.view(data.size(0), -1)
-                        return {name: data.cpu().numpy().tolist()}
-                
+            for name, data in self._weight_matrices(layer_name):
+                meta = None
+                if view:
+                    data, meta = apply_view(data, view)
+                # Copy, so callers never hold a live view of a parameter that training updates in place
+                return data.clone(), meta
+        return None, None
+
+    def get_weights(self, layer_name=None, fmt="json", compress=False, view=None):
+        """
+        Retrieve raw weights for heatmap visualization.
+        fmt='json' returns {name: nested lists}; 'f16' / 'u8' return a binary snapshot
+        (see backend.utils.weight_codec), optionally zlib-compressed.
+        `view` (from backend.utils.heatmap.parse_view) crops/downsamples each layer on the
+        device first; what the values cover is reported under '_meta' (JSON) or in the binary header.
+        """
+        if not self.model:
+            return {} if fmt == "json" else encode_weights([], fmt, compress)
+        with torch.no_grad():
+            layers = list(self._weight_matrices(layer_name))
+            if layer_name and not layers:
                 # DEBUG: If we loop through everything and don't find it, print what we HAVE.
                 print(f"DEBUG: Requested layer '{layer_name}' NOT FOUND. Available: {[n for n, _ in self.model.named_parameters() if 'weight' in n][:5]}...")
-                return {} # Return empty to avoid sending 300MB of data!
-            
-            # Return all weights (flattened) - ONLY if no layer_name was specified
-            weights = {}
-            for name, param in self.model.named_parameters():
-                if 'weight' in name:
-                    data = param
-                    if data.dim() > 2:
-                        data = data.view(data.size(0), -1)
-                    weights[name] = data.cpu().numpy().tolist()
-            return weights
+                # Return empty to avoid sending 300MB of data!
+
+            meta = {}
+            if view:
+                viewed = []
+                for name, data in layers:
+                    data, meta[name] = apply_view(data, view)
+                    viewed.append((name, data))
+                layers = viewed
+
+            if fmt == "json":
+                weights = {name: data.cpu().numpy().tolist() for name, data in layers}
+                if meta:
+                    weights["_meta"] = meta
+                return weights
+            return encode_weights(layers, fmt, compress, meta)
+
+    def weights_etag(self, layer_name=None, fmt="json", compress=False, view=None):
+        """
+        Entity tag for a weight snapshot request: it changes whenever the weights (or the model) change.
+        """
+        request_key = zlib.crc32(repr((layer_name, fmt, compress, view)).encode('utf-8'))
+        return f"{self.instance_token}-{self.generation}-{self.step}-{request_key:08x}"
+
+    def get_weights_snapshot(self, layer_name=None, fmt="json", compress=False, view=None):
+        """
+        Serialized get_weights() output plus its ETag, cached per (layer, format, view) and weight version.
+        Polling a paused or stopped session just returns the cached bytes.
+        """
+        etag = self.weights_etag(layer_name, fmt, compress, view)
+        key = (layer_name, fmt, compress, repr(view))
+        with self._snapshot_lock:
+            cached = self._snapshot_cache.get(key)
+        if cached and cached[0] == etag:
+            return cached
+
+        body = self.get_weights(layer_name, fmt, compress, view)
+        if fmt == "json":
+            body = json.dumps(body, separators=(',', ':')).encode('utf-8')
+        with self._snapshot_lock:
+            # Bounded: zoom/range requests could otherwise create unlimited keys
+            if len(self._snapshot_cache) >= SNAPSHOT_CACHE_SIZE:
+                self._snapshot_cache.clear()
+            self._snapshot_cache[key] = (etag, body)
+        return etag, body
+
+    def publish_inference_snapshot(self):
+        """
+        Replaces the inference snapshot with a frozen copy of the current weights.
+        Must not run concurrently with a training step: the training loop calls it between steps,
+        other callers only when no training is running (see request_inference_snapshot).
+        """
+        config = self.config or {}
+        self.inference_snapshot = InferenceSnapshot(self.model, (self.generation, self.step), self.memory_format,
+                                                    fuse=config.get('fuse_inference', False),
+                                                    compile_mode=resolve_compile_mode(config.get('compile', 'off')),
+                                                    architecture=config.get('architecture', 'mlp'), log=self._log)
+        self._inference_requested = False
+        return self.inference_snapshot
+
+    def request_inference_snapshot(self):
+        """
+        On-demand snapshot. While training, the loop publishes it after the current step
+        (returns None); otherwise it is published right away and returned.
+        """
+        if self.busy:
+            self._inference_requested = True
+            return None
+        return self.publish_inference_snapshot()
+
+    def _current_inference_snapshot(self):
+        """
+        The snapshot predictions run on. start() publishes one before the loop begins, so this only
+        publishes itself when nothing is training (copying a model mid-step could tear it).
+        """
+        snapshot = self.inference_snapshot
+        if snapshot is None:
+            if self.busy:
+                raise RuntimeError("The model has no inference snapshot yet")
+            snapshot = self.publish_inference_snapshot()
+        return snapshot
 
     def predict(self, image_file):
         """
@@ -273,49 +726,66 @@ class Trainer:
         if not self.model: return {"prediction": -1, "confidence": 0, "processed_image": None}
         
         try:
-            from backend.utils.image_processing import process_image_for_prediction, image_to_base64, get_transform
+            from backend.utils.image_processing import prepare_upload, image_to_base64, digits_to_tensor
             
-            # Preprocess the uploaded image (Resize, Center, Grayscale)
-            processed_img = process_image_for_prediction(image_file)
-            if not processed_img:
+            # Preprocess the uploaded image (Resize, Center, Grayscale) into a uint8 array
+            digit = prepare_upload(image_file)
+            if digit is None:
                 raise ValueError("Image processing failed")
 
-            # Convert to Tensor for PyTorch
-            transform = get_transform()
-            img_tensor = transform(processed_img).unsqueeze(0).to(self.device)
+            # Convert to Tensor for PyTorch (normalized like get_transform(), straight from the pixels)
+            img_tensor = digits_to_tensor(digit[None]).to(self.device)
             
-            # Forward pass only (no training)
-            # CRITICAL: Must be in eval mode for ResNet BatchNorm to work with batch_size=1
-            was_training = self.model.training
-            self.model.eval()
-            try:
-                with torch.no_grad():
-                    output = self.model(img_tensor)
-                    probs = torch.nn.functional.softmax(output, dim=1)
-                    pred_idx = probs.argmax().item()
-                    confidence = probs[0][pred_idx].item()
-            finally:
-                # Restore original state (in case training is paused or running)
-                if was_training:
-                    self.model.train()
-                
-            img_str = image_to_base64(processed_img)
+            # Forward pass only (no training), on the frozen eval-mode snapshot: the live model
+            # is never touched, so this neither waits for nor disturbs the training loop.
+            # Requests arriving together share one batched pass, run in a native thread off the hub.
+            output, snapshot = self.prediction_batcher.submit(img_tensor)
+            with torch.no_grad():
+                probs = torch.nn.functional.softmax(output, dim=1)
+                pred_idx = probs.argmax().item()
+                confidence = probs[0][pred_idx].item()
+
+            img_str = image_to_base64(digit)
                 
             return {
                 "prediction": pred_idx, 
                 "confidence": confidence, 
-                "processed_image": f"data:image/png;base64,{img_str}"
+                "processed_image": f"data:image/png;base64,{img_str}",
+                "snapshot_step": snapshot.version[1]
             }
         except Exception as e:
             print(f"Prediction error: {e}")
             return {"prediction": -1, "confidence": 0, "processed_image": None}
 
+    def predict_batch(self, images, centering="box"):
+        """
+        Predictions for many images in one request, see image_processing.load_batch_images.
+        `images` is a list of (name, grayscale uint8 array or None if it could not be decoded).
+        They are preprocessed together by the vectorized prepare_digits() (see its `centering`)
+        and classified by the same snapshot, in batches of MAX_PREDICT_BATCH.
+        Returns (list of {name, prediction, confidence[, error]}, snapshot step).
+        """
+        from backend.utils.image_processing import prepare_digits, digits_to_tensor
+
+        valid = [i for i, (_, image) in enumerate(images) if image is not None]
+        results = [{"name": name, "prediction": -1, "confidence": 0, "error": "Image processing failed"}
+                   for name, _ in images]
+        if not valid:
+            return results, None
+
+        snapshot = self._current_inference_snapshot()
+        digits = tpool.execute(prepare_digits, [images[i][1] for i in valid], centering=centering)
+        inputs = digits_to_tensor(digits).to(self.device)
+        logits = run_snapshot(snapshot, inputs, MAX_PREDICT_BATCH)
+        with torch.no_grad():
+            confidences, predictions = torch.nn.functional.softmax(logits.float(), dim=1).max(dim=1)
+        for i, prediction, confidence in zip(valid, predictions.tolist(), confidences.tolist()):
+            results[i] = {"name": images[i][0], "prediction": prediction, "confidence": confidence}
+        return results, snapshot.version[1]
+
     def save_model(self):
         """Save the current model state to disk."""
         if not self.model: return None
-        path = os.path.abspath("model.pth")
+        path = os.path.abspath(f"model_{self.session_id}.pth")
         torch.save(self.model.state_dict(), path)
         return path
-
-# Global singleton instance to share state between routes
-trainer_instance = Trainer()
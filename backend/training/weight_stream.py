@@ -0,0 +1,151 @@
+"""
+Push-based weight streaming over Socket.IO.
+
+A client sends 'subscribe_weights' with a layer name and a rate; the server then pushes
+'weights_frame' events for that layer whenever the weights changed, at most `rate` times
+per second. Frames are either:
+  - 'full':  the whole (optionally downsampled) matrix, uint8-quantized with scale/zero, or
+  - 'delta': a sparse update against a frame the client acknowledged with 'ack_weights'
+             (int32 flat indices + float16 differences).
+Clients that never acknowledge simply keep receiving full frames; the server only remembers
+the last MAX_UNACKED_FRAMES of them, so such a client costs a bounded amount of memory.
+"""
+import time
+import torch
+from backend.extensions import socketio
+from backend.utils.weight_codec import quantize_uint8
+
+# Upper bound for the push rate of a single subscription (frames per second).
+MAX_STREAM_HZ = 10.0
+DEFAULT_STREAM_HZ = 2.0
+
+# A delta is only worth sending if it touches at most this fraction of the matrix.
+MAX_DELTA_DENSITY = 0.5
+
+# Changes smaller than this fraction of the layer's value range are not sent.
+DELTA_TOLERANCE = 1.0 / 255
+
+# Unacknowledged frames remembered per subscription, besides the acknowledged delta base.
+# An ack for an older frame is ignored (the client keeps getting deltas against its previous base).
+MAX_UNACKED_FRAMES = 8
+
+class WeightStream:
+    """
+    One subscription: a client (Socket.IO sid) watching one layer of one trainer.
+    Keeps the reconstructed state of the acknowledged frame and of the last few frames sent
+    after it, so deltas are always computed against exactly what the client holds.
+    """
+    def __init__(self, sid, trainer, layer, rate=DEFAULT_STREAM_HZ, view=None):
+        self.sid = sid
+        self.trainer = trainer
+        self.layer = layer
+        self.rate = min(MAX_STREAM_HZ, max(0.1, float(rate)))
+        self.view = view
+        self.active = True
+        self._seq = 0
+        self._sent = {}         # seq -> float32 tensor as reconstructed by the client
+        self._acked_seq = None
+        self._last_version = None
+
+    def acknowledge(self, seq):
+        """The client confirms it applied frame `seq`; older references are no longer needed."""
+        if seq in self._sent:
+            self._acked_seq = seq
+            self._sent = {s: ref for s, ref in self._sent.items() if s >= seq}
+
+    def run(self):
+        """Green background task: push a frame whenever the weights changed, within the rate cap."""
+        interval = 1.0 / self.rate
+        while self.active:
+            started = time.monotonic()
+            version = (self.trainer.generation, self.trainer.step)
+            if version != self._last_version:
+                try:
+                    frame = self._next_frame()
+                except ValueError as e:
+                    # A view that does not fit the layer (e.g. a zoom range past its end)
+                    socketio.emit('weights_error', {'error': str(e)}, to=self.sid)
+                    self.active = False
+                    if _streams.get(self.sid) is self:
+                        del _streams[self.sid]
+                    return
+                if frame is not None:
+                    self._last_version = version
+                    socketio.emit('weights_frame', frame, to=self.sid)
+            socketio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    def _next_frame(self):
+        current, meta = self.trainer.get_layer_tensor(self.layer, self.view)
+        if current is None:
+            return None
+        current = current.detach().float()
+        self._seq += 1
+        frame = {
+            "layer": self.layer,
+            "seq": self._seq,
+            "step": self.trainer.step,
+            "shape": list(current.shape),
+            "meta": meta,
+        }
+
+        base = self._sent.get(self._acked_seq)
+        if base is not None and base.shape == current.shape:
+            delta = self._delta_frame(base, current.cpu())
+            if delta is not None:
+                payload, reference = delta
+                frame.update(payload)
+                self._remember(reference)
+                return frame
+
+        q, scale, zero = quantize_uint8(current)
+        q = q.cpu()
+        frame.update({"kind": "full", "dtype": "uint8", "scale": scale, "zero": zero, "data": q.numpy().tobytes()})
+        # What the client will reconstruct: q * scale + zero, in float32
+        self._remember(q.float() * scale + zero)
+        return frame
+
+    def _remember(self, reference):
+        """Stores the state of the frame just built, dropping the oldest unacknowledged ones."""
+        self._sent[self._seq] = reference
+        unacked = sorted(seq for seq in self._sent if seq != self._acked_seq)
+        for seq in unacked[:-MAX_UNACKED_FRAMES]:
+            del self._sent[seq]
+
+    def _delta_frame(self, base, current):
+        """Sparse float16 update from `base` to `current`, or None if a full frame is cheaper."""
+        diff = current - base
+        value_range = float(current.max() - current.min()) or 1.0
+        changed = (diff.abs() > value_range * DELTA_TOLERANCE).flatten().nonzero().flatten()
+        if changed.numel() > MAX_DELTA_DENSITY * current.numel():
+            return None
+        values = diff.flatten()[changed].to(torch.float16)
+        reference = base.clone()
+        reference.view(-1)[changed] += values.float()
+        payload = {
+            "kind": "delta",
+            "base_seq": self._acked_seq,
+            "indices": changed.to(torch.int32).numpy().tobytes(),
+            "values": values.numpy().tobytes(),
+        }
+        return payload, reference
+
+# Active subscriptions by Socket.IO sid (one per client).
+_streams = {}
+
+def subscribe(sid, trainer, layer, rate=DEFAULT_STREAM_HZ, view=None):
+    """Starts (or replaces) the weight stream of a client."""
+    unsubscribe(sid)
+    stream = WeightStream(sid, trainer, layer, rate, view)
+    _streams[sid] = stream
+    socketio.start_background_task(stream.run)
+    return stream
+
+def unsubscribe(sid):
+    stream = _streams.pop(sid, None)
+    if stream:
+        stream.active = False
+
+def acknowledge(sid, seq):
+    stream = _streams.get(sid)
+    if stream:
+        stream.acknowledge(seq)
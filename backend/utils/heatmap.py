@@ -0,0 +1,91 @@
+"""
+Server-side views of weight matrices for the heatmap.
+
+A browser canvas cannot usefully show a 512x4608 conv matrix pixel-for-pixel, so
+/api/weights can crop a row/column range (zoom) and pool the result down to a target
+resolution before anything leaves the device. That bounds the response size whatever
+the architecture.
+"""
+import torch.nn.functional as F
+
+REDUCTIONS = ("mean", "absmax")
+
+def _parse_range(value, name):
+    """Parses 'start:stop' (either side optional) into a slice."""
+    if value is None:
+        return None
+    try:
+        start, stop = value.split(':')
+        return slice(int(start) if start else None, int(stop) if stop else None)
+    except ValueError:
+        raise ValueError(f"'{name}' must look like 'start:stop', got '{value}'")
+
+def _parse_size(value, name):
+    if value is None:
+        return None
+    try:
+        size = int(value)
+    except ValueError:
+        raise ValueError(f"'{name}' must be an integer, got '{value}'")
+    if size < 1:
+        raise ValueError(f"'{name}' must be at least 1")
+    return size
+
+def parse_view(args):
+    """
+    Builds a view description from request arguments, or None if no view was asked for.
+    Raises ValueError on malformed input.
+
+    max_rows / max_cols: target resolution (upper bound, small layers are never upscaled)
+    reduce: 'mean' (average of each block) or 'absmax' (strongest weight of each block, sign kept)
+    rows / cols: 'start:stop' ranges of the (flattened) matrix to zoom into
+    """
+    view = {
+        "max_rows": _parse_size(args.get('max_rows'), 'max_rows'),
+        "max_cols": _parse_size(args.get('max_cols'), 'max_cols'),
+        "reduce": args.get('reduce', 'mean'),
+        "rows": _parse_range(args.get('rows'), 'rows'),
+        "cols": _parse_range(args.get('cols'), 'cols'),
+    }
+    if view["reduce"] not in REDUCTIONS:
+        raise ValueError(f"'reduce' must be one of {list(REDUCTIONS)}")
+    if all(view[k] is None for k in ("max_rows", "max_cols", "rows", "cols")):
+        return None
+    return view
+
+def apply_view(matrix, view):
+    """
+    Crops and pools a 1D/2D weight tensor on its own device.
+    1D tensors (biases, BatchNorm scales) are treated as a single row.
+    Returns (tensor, meta) where meta records which part of the layer the values cover.
+    Raises ValueError if the rows/cols ranges select nothing (outside the layer, or reversed).
+    """
+    source_shape = list(matrix.shape)
+    is_vector = matrix.dim() == 1
+    x = matrix.unsqueeze(0) if is_vector else matrix
+
+    row_start, row_stop, _ = (slice(None) if is_vector else (view["rows"] or slice(None))).indices(x.size(0))
+    col_start, col_stop, _ = (view["cols"] or slice(None)).indices(x.size(1))
+    if row_stop <= row_start or col_stop <= col_start:
+        raise ValueError(f"The zoom range rows {row_start}:{row_stop}, cols {col_start}:{col_stop} "
+                         f"is empty for a layer of shape {source_shape}")
+    x = x[row_start:row_stop, col_start:col_stop]
+
+    out_rows = min(x.size(0), view["max_rows"] or x.size(0))
+    out_cols = min(x.size(1), view["max_cols"] or x.size(1))
+    if (out_rows, out_cols) != tuple(x.shape):
+        grid = x.float().unsqueeze(0).unsqueeze(0)
+        if view["reduce"] == "absmax":
+            # Pick the largest magnitude in each block, but report it with its sign
+            _, idx = F.adaptive_max_pool2d(grid.abs(), (out_rows, out_cols), return_indices=True)
+            x = grid.flatten().gather(0, idx.flatten()).view(out_rows, out_cols)
+        else:
+            x = F.adaptive_avg_pool2d(grid, (out_rows, out_cols)).view(out_rows, out_cols)
+
+    meta = {
+        "source_shape": source_shape,
+        "rows": [row_start, row_stop],
+        "cols": [col_start, col_stop],
+        "reduce": view["reduce"],
+    }
+    return (x.view(-1) if is_vector else x), meta
@@ -1,9 +1,25 @@
 import io
 import base64
+import zipfile
 import numpy as np
+import torch
+import torch.nn.functional as F
 from PIL import Image, ImageOps 
 import torchvision.transforms as transforms
 
+# Mean and standard deviation of the MNIST training set
+MNIST_MEAN, MNIST_STD = 0.1307, 0.3081
+
+# After inverting, every pixel brighter than this is ink (255), the rest background (0).
+INK_THRESHOLD = 50
+# Thresholding as a lookup table (for PIL's Image.point, a C lookup instead of a Python call per value)
+_THRESHOLD_LUT = [255 if p > INK_THRESHOLD else 0 for p in range(256)]
+# Inversion and thresholding in one lookup table, indexed by the raw grayscale value
+_INK_LUT = np.array(_THRESHOLD_LUT[::-1], dtype=np.uint8)
+# Raw values below this are ink: the same test as the table, as one comparison
+_INK_BELOW = 255 - INK_THRESHOLD
+CENTERINGS = ("box", "mass")
+
 def process_image_for_prediction(image_file, target_size=20, final_size=28):
     """
     Prepares a raw uploaded image for the Neural Network.
@@ -19,57 +35,281 @@ def process_image_for_prediction(image_file, target_size=20, final_size=28):
         image_file: The raw file object from the request.
         target_size: The size of the digit itself (bounding box).
         final_size: The final canvas size (28x28 standard).
+
+    Returns the digit as a PIL image (None on error); prepare_upload() returns the array itself.
+    """
+    digit = prepare_upload(image_file, target_size, final_size)
+    return None if digit is None else Image.fromarray(digit, mode='L')
+
+def prepare_upload(image_file, target_size=20, final_size=28):
+    """
+    process_image_for_prediction() without the PIL round trip: the prepared digit as a uint8
+    array [final_size, final_size] from the vectorized prepare_digits(), or None on error.
     """
     try:
         # Read file into memory and convert to Grayscale (L mode)
         image_bytes = image_file.read()
-        img = Image.open(io.BytesIO(image_bytes)).convert('L')
-        
-        # 1. Invert colors 
-        # Most users draw black ink on white paper, but MNIST is white ink on black background.
-        img = ImageOps.invert(img)
-        
-        # 2. Boost Contrast (Thresholding)
-        # Remove noise (faint gray lines) and ensure solid white digits.
-        img = img.point(lambda p: 255 if p > 50 else 0)
-        
-        # 3. Auto-crop to content
-        # Find the bounding box of the non-zero (white) pixels and crop to it.
-        # This centers the digit purely based on its content, not the canvas interactions.
-        bbox = img.getbbox()
-        if bbox:
-            img = img.crop(bbox)
-        
-        # 4. Resize maintaining aspect ratio
-        w, h = img.size
-        new_w, new_h = target_size, target_size 
-        
-        if w > 0 and h > 0:
-            ratio = min(target_size/w, target_size/h)
-            new_w, new_h = max(1, int(w * ratio)), max(1, int(h * ratio))
-            
-            # Use High-quality downsampling filter
-            resample_method = getattr(Image, 'Resampling', Image).LANCZOS
-            img = img.resize((new_w, new_h), resample_method)
-            
-            # Re-apply threshold to prevent "fuzziness" from resizing interpolation
-            img = img.point(lambda p: 255 if p > 50 else 0)
-        
-        # 5. Center Paste onto 28x28 Canvas
-        # Create a black background and paste the resized digit in the exact center.
-        new_img = Image.new('L', (final_size, final_size), 0)
-        offset_x = (final_size - new_w) // 2
-        offset_y = (final_size - new_h) // 2
-        new_img.paste(img, (offset_x, offset_y))
+        pixels = np.asarray(Image.open(io.BytesIO(image_bytes)).convert('L'))
+        return prepare_digits([pixels], target_size, final_size)[0]
+    except Exception as e:
+        print(f"Error in image processing: {e}")
+        return None
+
+def prepare_digit(img, target_size=20, final_size=28):
+    """
+    The MNIST-style normalization for one already decoded grayscale PIL image, step by step
+    with PIL. prepare_digits() is the vectorized version the app uses; this one is the
+    reference it is checked against (backend/tests/test_image_processing.py).
+    """
+    # 1. Invert colors 
+    # Most users draw black ink on white paper, but MNIST is white ink on black background.
+    img = ImageOps.invert(img)
+    
+    # 2. Boost Contrast (Thresholding)
+    # Remove noise (faint gray lines) and ensure solid white digits.
+    img = img.point(_THRESHOLD_LUT)
+    
+    # 3. Auto-crop to content
+    # Find the bounding box of the non-zero (white) pixels and crop to it.
+    # This centers the digit purely based on its content, not the canvas interactions.
+    bbox = img.getbbox()
+    if bbox:
+        img = img.crop(bbox)
+    
+    # 4. Resize maintaining aspect ratio
+    w, h = img.size
+    new_w, new_h = target_size, target_size 
+    
+    if w > 0 and h > 0:
+        ratio = min(target_size/w, target_size/h)
+        new_w, new_h = max(1, int(w * ratio)), max(1, int(h * ratio))
         
-        return new_img
+        # Use High-quality downsampling filter
+        resample_method = getattr(Image, 'Resampling', Image).LANCZOS
+        img = img.resize((new_w, new_h), resample_method)
         
+        # Re-apply threshold to prevent "fuzziness" from resizing interpolation
+        img = img.point(_THRESHOLD_LUT)
+    
+    # 5. Center Paste onto 28x28 Canvas
+    # Create a black background and paste the resized digit in the exact center.
+    new_img = Image.new('L', (final_size, final_size), 0)
+    offset_x = (final_size - new_w) // 2
+    offset_y = (final_size - new_h) // 2
+    new_img.paste(img, (offset_x, offset_y))
+    
+    return new_img
+
+# Limits for /api/predict-batch uploads
+MAX_BATCH_IMAGES = 256
+MAX_ARCHIVE_MEMBER_BYTES = 5 * 1024 * 1024
+# Decoded size of one .npz array (all its images), checked from its header before loading
+MAX_NPZ_ARRAY_BYTES = 64 * 1024 * 1024
+
+# .npy header readers by format version (3.0 only differs in allowing non-ASCII field names)
+_NPY_HEADER_READERS = {
+    (1, 0): np.lib.format.read_array_header_1_0,
+    (2, 0): np.lib.format.read_array_header_2_0,
+}
+
+def _to_uint8(array, unit_range=None):
+    """
+    uint8 grayscale array from an array of 0-255 values, or of 0-1 floats when unit_range
+    is True (by default: when no value exceeds 1).
+    """
+    array = np.asarray(array)
+    if array.dtype == np.uint8:
+        return array
+    if unit_range is None:
+        unit_range = array.max(initial=0) <= 1.0
+    array = array.astype(np.float32)
+    if unit_range:
+        array *= 255
+    return np.clip(array, 0, 255).astype(np.uint8)
+
+def _npz_arrays(filename, data, room):
+    """
+    Yields (key, array [N, H, W] or None) for the arrays of an .npz upload, without np.load:
+    each member's shape and dtype are read from its .npy header and checked against the
+    limits (`room` = images still allowed in the batch) before any data is decompressed.
+    None marks arrays that are not grayscale images or too large (each counts as one image).
+    """
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile:
+        raise ValueError(f"'{filename}' is not a valid .npz archive")
+    with archive:
+        for info in archive.infolist():
+            if not info.filename.endswith('.npy'):
+                continue
+            key = info.filename[:-len('.npy')]
+            array = None
+            with archive.open(info) as member:
+                try:
+                    read_header = _NPY_HEADER_READERS.get(np.lib.format.read_magic(member))
+                    header = read_header(member) if read_header else None
+                except ValueError:
+                    header = None
+                if header is not None:
+                    array = _read_npy_images(member, *header, room)
+            room -= len(array) if array is not None else 1
+            yield key, array
+
+def _read_npy_images(member, shape, fortran_order, dtype, room):
+    """
+    The data of one .npy member as [N, H, W], if its header describes grayscale images within
+    the limits, else None. Reads exactly the announced number of bytes, never more.
+    """
+    if len(shape) not in (2, 3) or dtype.kind not in 'biuf' or dtype.hasobject:
+        return None
+    shape = shape if len(shape) == 3 else (1,) + shape
+    count, height, width = shape
+    if count > room:
+        raise ValueError(f"Too many images (max {MAX_BATCH_IMAGES})")
+    image_bytes = height * width * dtype.itemsize
+    if count * image_bytes > MAX_NPZ_ARRAY_BYTES or image_bytes > MAX_ARCHIVE_MEMBER_BYTES:
+        return None
+    raw = member.read(count * image_bytes)
+    if len(raw) != count * image_bytes:
+        return None
+    return np.frombuffer(raw, dtype=dtype).reshape(shape, order='F' if fortran_order else 'C')
+
+def _decode_grayscale(image_file):
+    """uint8 [H, W] array of an image file, or None if it cannot be decoded."""
+    try:
+        return np.asarray(Image.open(image_file).convert('L'))
     except Exception as e:
         print(f"Error in image processing: {e}")
         return None
 
+def load_batch_images(files):
+    """
+    Expands the uploaded files of a batch prediction into (name, grayscale uint8 array) pairs,
+    still to be normalized with prepare_digits().
+    Accepts image files, .zip archives of image files and .npz archives of grayscale arrays
+    ([N, H, W] or [H, W], drawn like the uploads: dark ink on a light background).
+    The array is None for entries that could not be decoded. Raises ValueError past MAX_BATCH_IMAGES.
+    """
+    images = []
+    def add(name, image):
+        if len(images) >= MAX_BATCH_IMAGES:
+            raise ValueError(f"Too many images (max {MAX_BATCH_IMAGES})")
+        images.append((name, image))
+
+    for file in files:
+        filename = file.filename or "image"
+        lowered = filename.lower()
+        if lowered.endswith('.zip'):
+            try:
+                archive = zipfile.ZipFile(io.BytesIO(file.read()))
+            except zipfile.BadZipFile:
+                raise ValueError(f"'{filename}' is not a valid zip archive")
+            with archive:
+                for info in archive.infolist():
+                    if info.is_dir():
+                        continue
+                    if info.file_size > MAX_ARCHIVE_MEMBER_BYTES:
+                        add(info.filename, None)
+                        continue
+                    add(info.filename, _decode_grayscale(io.BytesIO(archive.read(info))))
+        elif lowered.endswith('.npz'):
+            for key, stack in _npz_arrays(filename, file.read(), MAX_BATCH_IMAGES - len(images)):
+                if stack is None:
+                    add(f"{filename}:{key}", None)
+                    continue
+                # One scale for the whole stack, converted image by image (no float copy of the stack)
+                unit_range = stack.dtype != np.uint8 and stack.max(initial=0) <= 1.0
+                for i in range(len(stack)):
+                    add(f"{filename}:{key}[{i}]", _to_uint8(stack[i], unit_range))
+        else:
+            add(filename, _decode_grayscale(file))
+    return images
+
+def _ink_bounds(mask):
+    """(top, bottom, left, right) bounds of the True pixels of each [H, W] mask of a [N, H, W] stack."""
+    rows, cols = mask.any(axis=2), mask.any(axis=1)
+    top = rows.argmax(axis=1)
+    bottom = rows.shape[1] - rows[:, ::-1].argmax(axis=1)
+    left = cols.argmax(axis=1)
+    right = cols.shape[1] - cols[:, ::-1].argmax(axis=1)
+    return np.stack([top, bottom, left, right], axis=1), rows.any(axis=1)
+
+def _resize_digit(digit, new_h, new_w):
+    """Resizes a thresholded uint8 digit: area averaging when shrinking, bilinear when enlarging."""
+    t = torch.from_numpy(digit).float()[None, None]
+    if new_h <= digit.shape[0] and new_w <= digit.shape[1]:
+        t = F.interpolate(t, size=(new_h, new_w), mode='area')
+    else:
+        t = F.interpolate(t, size=(new_h, new_w), mode='bilinear', align_corners=False)
+    # Re-threshold, like the PIL pipeline, to keep the strokes solid
+    return np.where(t[0, 0].numpy() > INK_THRESHOLD, 255, 0).astype(np.uint8)
+
+def prepare_digits(images, target_size=20, final_size=28, centering="box"):
+    """
+    prepare_digit() for a batch of grayscale images, without PIL: bounding boxes from the ink
+    mask of the whole stack, one lookup table for inversion + threshold of each crop, area
+    resize and placement by array slicing.
+
+    Args:
+        images: uint8 array [N, H, W], or a list of [H, W] arrays of any sizes.
+        centering: 'box' centers the bounding box, like prepare_digit(). 'mass' puts the center
+            of mass at the center of the canvas, like the original MNIST preprocessing.
+
+    Returns a uint8 array [N, final_size, final_size] of white digits on black.
+    Resampling differs from PIL's LANCZOS, so a few edge pixels may differ from prepare_digit();
+    backend/tests/test_image_processing.py bounds the difference.
+    """
+    if centering not in CENTERINGS:
+        raise ValueError(f"Unknown centering '{centering}', expected one of {CENTERINGS}")
+    if isinstance(images, np.ndarray) and images.ndim == 3:
+        groups = [images]
+    else:
+        groups = [np.asarray(image)[None] for image in images]
+
+    out = []
+    for stack in groups:
+        stack = stack.astype(np.uint8, copy=False)
+        # Bounds of the whole stack at once; only the crops go through the lookup table
+        bounds, has_ink = _ink_bounds(stack < _INK_BELOW)
+        canvas = np.zeros((len(stack), final_size, final_size), dtype=np.uint8)
+        for i, (top, bottom, left, right) in enumerate(bounds):
+            if not has_ink[i]:
+                continue
+            digit = _INK_LUT[stack[i, top:bottom, left:right]]
+            h, w = digit.shape
+            ratio = min(target_size / w, target_size / h)
+            new_w, new_h = max(1, int(w * ratio)), max(1, int(h * ratio))
+            digit = _resize_digit(digit, new_h, new_w)
+            if centering == "mass" and digit.any():
+                ys, xs = np.nonzero(digit)
+                y = int(round((final_size - 1) / 2 - ys.mean()))
+                x = int(round((final_size - 1) / 2 - xs.mean()))
+                # Keep the whole digit on the canvas
+                y, x = min(max(y, 0), final_size - new_h), min(max(x, 0), final_size - new_w)
+            else:
+                y, x = (final_size - new_h) // 2, (final_size - new_w) // 2
+            canvas[i, y:y + new_h, x:x + new_w] = digit
+        out.append(canvas)
+    if not out:
+        return np.zeros((0, final_size, final_size), dtype=np.uint8)
+    return np.concatenate(out)
+
+def digits_to_tensor(digits):
+    """
+    get_transform() for a uint8 array [N, H, W] of prepared digits: a normalized float
+    tensor [N, 1, H, W], built directly from the array.
+    """
+    digits = np.ascontiguousarray(digits)
+    if not digits.flags.writeable:
+        # torch.from_numpy warns on read-only memory (e.g. np.asarray of a PIL image)
+        digits = digits.copy()
+    t = torch.from_numpy(digits).float().div_(255)
+    return t.sub_(MNIST_MEAN).div_(MNIST_STD).unsqueeze(1)
+
 def image_to_base64(pil_image):
-    """Helper to convert a PIL Image to a Data URL string for frontend display."""
+    """Helper to convert a PIL Image (or a uint8 grayscale array) to a Data URL string for frontend display."""
+    if isinstance(pil_image, np.ndarray):
+        pil_image = Image.fromarray(pil_image, mode='L')
     buffered = io.BytesIO()
     pil_image.save(buffered, format="PNG")
     return base64.b64encode(buffered.getvalue()).decode("utf-8")
@@ -81,5 +321,5 @@ def get_transform():
     """
     return transforms.Compose([
         transforms.ToTensor(),
-        transforms.Normalize((0.1307,), (0.3081,)) # Mean and Std Dev for MNIST
+        transforms.Normalize((MNIST_MEAN,), (MNIST_STD,))
     ])
@@ -0,0 +1,98 @@
+"""
+Binary encoding for weight snapshots (/api/weights?format=f16|u8).
+
+Layout of a snapshot:
+    b'NNTW' | uint32 little-endian header length | JSON header (utf-8) | raw layer data
+
+The header lists every layer as
+    {"name", "shape", "dtype", "offset", "nbytes", "scale", "zero"}
+where offset/nbytes locate the layer inside the raw data section.
+Layers served through a heatmap view (utils/heatmap.py) also carry its metadata
+(source_shape, rows, cols, reduce).
+  - float16 layers: values are stored directly, scale/zero are unused (1.0 / 0.0).
+  - uint8 layers: value = q * scale + zero, with per-layer min/max quantization.
+
+The whole body may be zlib-compressed; the API sends it with 'Content-Encoding: deflate'
+so browsers inflate it transparently.
+"""
+import json
+import struct
+import zlib
+import torch
+
+MAGIC = b'NNTW'
+FORMATS = {"f16": "float16", "u8": "uint8"}
+MIMETYPE = 'application/octet-stream'
+
+def quantize_uint8(tensor):
+    """
+    Per-layer affine quantization to uint8, computed on the tensor's own device.
+    Returns (q, scale, zero) so that tensor ~= q * scale + zero.
+    """
+    tensor = tensor.detach().float()
+    if tensor.numel() == 0:
+        # min()/max() are undefined on empty tensors
+        return tensor.to(torch.uint8), 1.0, 0.0
+    lo, hi = tensor.min(), tensor.max()
+    scale = (hi - lo) / 255
+    scale = torch.where(scale > 0, scale, torch.ones_like(scale))
+    q = ((tensor - lo) / scale).round_().clamp_(0, 255).to(torch.uint8)
+    # One host transfer for both scalars
+    scale, zero = torch.stack([scale, lo]).tolist()
+    return q, scale, zero
+
+def encode_weights(layers, fmt="f16", compress=False, meta=None):
+    """
+    Encodes an iterable of (name, tensor) pairs into one binary snapshot.
+    Conversion happens on the device, so only the compact representation is copied to the host.
+    `meta` optionally maps layer names to extra header fields.
+    """
+    meta = meta or {}
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown weight format '{fmt}'. Expected one of {list(FORMATS)}")
+
+    header = {"version": 1, "layers": []}
+    chunks = []
+    offset = 0
+    for name, tensor in layers:
+        if fmt == "u8":
+            data, scale, zero = quantize_uint8(tensor)
+        else:
+            data, scale, zero = tensor.detach().to(torch.float16), 1.0, 0.0
+        raw = data.contiguous().cpu().numpy().tobytes()
+        header["layers"].append({
+            "name": name,
+            "shape": list(tensor.shape),
+            "dtype": FORMATS[fmt],
+            "offset": offset,
+            "nbytes": len(raw),
+            "scale": scale,
+            "zero": zero,
+            **meta.get(name, {}),
+        })
+        chunks.append(raw)
+        offset += len(raw)
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    body = b''.join([MAGIC, struct.pack('<I', len(header_bytes)), header_bytes] + chunks)
+    if compress:
+        body = zlib.compress(body, 1) # Fast level: the goal is to cut bandwidth, not CPU
+    return body
+
+def decode_weights(body):
+    """
+    Inverse of encode_weights (uncompressed body). Returns {name: float32 tensor}.
+    Mainly useful for Python clients and for checking the encoding.
+    """
+    if body[:4] != MAGIC:
+        body = zlib.decompress(body)
+    header_len = struct.unpack('<I', body[4:8])[0]
+    header = json.loads(body[8:8 + header_len].decode('utf-8'))
+    data = body[8 + header_len:]
+    weights = {}
+    for layer in header["layers"]:
+        raw = bytearray(data[layer["offset"]:layer["offset"] + layer["nbytes"]])
+        dtype = torch.uint8 if layer["dtype"] == "uint8" else torch.float16
+        values = torch.frombuffer(raw, dtype=dtype).float() if raw else torch.empty(0)
+        weights[layer["name"]] = (values * layer["scale"] + layer["zero"]).view(layer["shape"])
+    return weights
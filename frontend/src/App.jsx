@@ -9,6 +9,7 @@ import ExplanationModal from './components/ExplanationModal';
 import TrainingLog from './components/TrainingLog';
 import UploadZone from './components/UploadZone';
 import { socket, connectSocket, disconnectSocket } from './utils/websocket';
+import { decodeTrainingUpdate } from './utils/telemetry';
 import config from './config';
 
 /**
@@ -36,6 +37,11 @@ function App() {
     batch_size: 64
   });
 
+  // --- Session ---
+  // Each browser trains its own model on the server, identified by the model_id from /api/create-model
+  const [modelId, setModelId] = useState(null);
+  const modelIdRef = React.useRef(null);
+
   // --- Real-time Data State ---
   const [status, setStatus] = useState('idle');
   const [metrics, setMetrics] = useState(null); // The latest data packet from backend
@@ -51,6 +57,7 @@ function App() {
   // --- WebSocket Setup ---
   // --- WebSocket Setup ---
   const isMounted = React.useRef(false);
+  const lastLogBucket = React.useRef(null);
 
   useEffect(() => {
     // Prevent double-connection/logging in StrictMode (dev)
@@ -62,46 +69,101 @@ function App() {
     // Define handlers so they can be removed by reference (though anonymous wrappers w/ socket.off(name) work too for all)
     // For simplicity in this codebase, strict event name removal works well since we have single listeners per event type usually.
 
+    // Events are scoped to our session room; this guards against stale rooms after a session switch
+    const isOurs = (data) => !data.model_id || data.model_id === modelIdRef.current;
+
+    // Training events are only sent to the session's room; (re)join it on every (re)connect
+    socket.on('connect', () => {
+      if (modelIdRef.current) socket.emit('join_session', { model_id: modelIdRef.current });
+    });
+
     socket.on('status', (data) => addLog(data.msg));
-    socket.on('log', (data) => addLog(data.message)); // Display backend debug logs
+    socket.on('log', (data) => isOurs(data) && addLog(data.message)); // Display backend debug logs
 
-    // Listen for the high-frequency training updates (every 10 batches or so)
-    socket.on('training_update', (data) => {
+    // Listen for the high-frequency training updates (a few per second, paced by the backend)
+    socket.on('training_update', (packet) => {
+      if (!isOurs(packet)) return;
+      const data = decodeTrainingUpdate(packet); // Unpack binary frames (telemetry_format: 'binary')
       setMetrics(data);
       setHistory(prev => [...prev, data]);
-      // Only log occasionally to avoid spamming the log panel
-      if (data.batch % 100 === 0) {
-        addLog(`Epoch ${data.epoch} | Batch ${data.batch}/${data.total_batches} | Loss: ${data.loss.toFixed(4)}`);
+      // Only log occasionally to avoid spamming the log panel.
+      // Updates are time-based, so log whenever we cross into a new block of 100 batches.
+      const bucket = `${data.epoch}:${Math.floor(data.batch / 100)}`;
+      if (bucket !== lastLogBucket.current) {
+        lastLogBucket.current = bucket;
+        const speed = data.samples_per_sec ? ` | ${Math.round(data.samples_per_sec)} samples/s` : '';
+        addLog(`Epoch ${data.epoch} | Batch ${data.batch}/${data.total_batches} | Loss: ${data.loss.toFixed(4)}${speed}`);
       }
     });
 
-    socket.on('training_complete', () => {
+    socket.on('training_complete', (data) => {
+      if (!isOurs(data)) return;
       setStatus('complete');
       addLog("Training Complete!");
     });
 
+    // Queue position / ETA while our run waits for a free training slot
+    socket.on('queue_update', (job) => {
+      if (!isOurs(job)) return;
+      if (job.status === 'queued') {
+        setStatus('queued');
+        addLog(`Queued: position ${job.position}, starting in ~${Math.round(job.eta_start)}s`);
+      } else if (job.status === 'running') {
+        setStatus('training');
+        setHistory([]);
+        addLog("Slot available, training started.");
+      } else if (job.status === 'failed') {
+        setStatus('idle');
+        addLog("Queued training failed to start: " + job.error);
+      }
+    });
+
     // Cleanup on unmount
     return () => {
+      socket.off('connect');
       socket.off('status');
       socket.off('log');
       socket.off('training_update');
       socket.off('training_complete');
+      socket.off('queue_update');
       disconnectSocket();
     };
   }, []);
 
   // --- Handlers ---
+  // Returns this browser's session id, creating the session on first use
+  const ensureModelId = async () => {
+    if (modelIdRef.current) return modelIdRef.current;
+    const response = await fetch(`${config.API_URL}/api/create-model`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({})
+    });
+    const data = await response.json();
+    if (!response.ok) throw new Error(data.error || data.status || "Could not create a session");
+    modelIdRef.current = data.model_id;
+    setModelId(data.model_id);
+    socket.emit('join_session', { model_id: data.model_id });
+    return data.model_id;
+  };
+
   const handleStart = async () => {
     try {
       addLog(`Starting training with ${appConfig.architecture} on ${appConfig.dataset}...`);
+      const id = await ensureModelId();
       // Send the configuration to the backend to initialize the Trainer
       const response = await fetch(`${config.API_URL}/api/start-training`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(appConfig)
+        // 'sid' lets the server put this socket in the session room before any event is emitted
+        body: JSON.stringify({ ...appConfig, model_id: id, sid: socket.id })
       });
       const data = await response.json();
-      if (response.ok) {
+      if (response.status === 202) {
+        // Server is at capacity: the run starts by itself, 'queue_update' reports progress
+        setStatus('queued');
+        addLog(`Server busy, queued at position ${data.position} (~${Math.round(data.eta_start)}s)`);
+      } else if (response.ok) {
         setStatus('training');
         setHistory([]); // Reset charts for new run
       } else {
@@ -118,7 +180,11 @@ function App() {
   const handleStop = async () => {
     try {
       addLog("Stopping training...");
-      await fetch(`${config.API_URL}/api/stop-training`, { method: 'POST' });
+      await fetch(`${config.API_URL}/api/stop-training`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ model_id: modelIdRef.current })
+      });
       setStatus('idle');
       addLog("Training stopped by user.");
     } catch (error) {
@@ -155,7 +221,7 @@ function App() {
 
         {/* Left Sidebar: Controls */}
         <aside className="left-sidebar" style={{ width: '300px', background: '#0f172a', padding: '20px', borderRadius: '12px', display: 'flex', flexDirection: 'column', gap: '20px', overflowY: 'auto' }}>
-          <ControlPanel config={appConfig} setConfig={setAppConfig} onStart={handleStart} onStop={handleStop} isTraining={status === 'training'} />
+          <ControlPanel config={appConfig} setConfig={setAppConfig} onStart={handleStart} onStop={handleStop} isTraining={status === 'training' || status === 'queued'} />
 
           {/* Export Section at bottom of sidebar */}
           <div style={{ marginTop: 'auto', paddingTop: '20px', borderTop: '1px solid #334155' }}>
@@ -169,7 +235,7 @@ function App() {
           <section className="center-view" style={{ flex: 1, position: 'relative', display: 'flex', flexDirection: 'column', minHeight: 0 }}>
             <div style={{ flex: 1, minHeight: 0, overflow: 'hidden' }}> {/* Wrapper to contain canvas/heatmap */}
               {activeTab === 'architecture' && <ArchitectureCanvas config={appConfig} weights={metrics} isTraining={status === 'training'} />}
-              {activeTab === 'heatmap' && <HeatmapViewer appConfig={appConfig} weights={metrics} isTraining={status === 'training'} />}
+              {activeTab === 'heatmap' && <HeatmapViewer appConfig={appConfig} modelId={modelId} weights={metrics} isTraining={status === 'training'} />}
             </div>
           </section>
 
@@ -183,7 +249,7 @@ function App() {
         </aside>
 
         {/* Floating Upload Widget (Only visible when model exists/training started) */}
-        {status !== 'idle' && <UploadZone />}
+        {status !== 'idle' && <UploadZone modelId={modelId} />}
       </main>
     </div>
   );
@@ -1,5 +1,13 @@
 import React, { useState, useEffect, useRef } from 'react';
-import config from '../config';
+import { socket } from '../utils/websocket';
+import { applyWeightFrame } from '../utils/weights';
+
+// Canvas resolution; also the largest matrix we ask the server for
+const CANVAS_WIDTH = 800;
+const CANVAS_HEIGHT = 400;
+
+// Weight frames per second requested from the server (it caps this too)
+const STREAM_RATE = 2;
 
 /**
  * HeatmapViewer Component
@@ -8,11 +16,11 @@ import config from '../config';
  * the actual weight matrices of the Linear layers.
  * 
  * Logic:
- * 1. Polls the backend for weight data of the selected layer.
+ * 1. Subscribes to a live stream of weight data for the selected layer.
  * 2. Renders the matrix as a heatmap on an HTML Canvas.
  * 3. Red pixels = Positive weights (Excitory), Blue pixels = Negative weights (Inhibitory).
  */
-const HeatmapViewer = ({ appConfig, isTraining }) => {
+const HeatmapViewer = ({ appConfig, modelId, isTraining }) => {
     const [layer, setLayer] = useState(appConfig && appConfig.architecture === 'lenet' ? 'conv1.weight' : 'fc1.weight');
     const [data, setData] = useState(null);
     const canvasRef = useRef(null);
@@ -48,48 +56,37 @@ const HeatmapViewer = ({ appConfig, isTraining }) => {
         }
     }, [appConfig]);
 
-    // --- Effect 1: Data Polling ---
+    // --- Effect 1: Live Weight Stream ---
+    // Instead of polling /api/weights, subscribe once and let the server push frames when weights change.
+    // After the first full frame, the server sends sparse deltas against the last frame we acknowledged.
     useEffect(() => {
-        let isMounted = true;
-        let timeoutId;
-
-        const fetchWeights = async () => {
-            try {
-                const start = Date.now();
-                // Add timestamp to prevent browser caching which causes "frozen" heatmaps
-                const res = await fetch(`${config.API_URL}/api/weights?layer=${layer}&_t=${start}`);
-                const json = await res.json();
-                if (isMounted && json[layer]) {
-                    const newData = json[layer];
-                    // DEBUG: Check if data is actually changing
-                    if (newData.length > 0 && newData[0].length > 0) {
-                        console.log(`Heatmap Update [${layer}]:`, newData[0][0]);
-                    }
-                    setData(newData);
-                }
-
-                // Adaptive polling: Wait longer if request was slow, but not too long.
-                const duration = Date.now() - start;
-                // Wait the same amount of time the request took (1:1 duty cycle), max 2s wait.
-                const delay = Math.min(2000, Math.max(500, duration));
-
-                if (isMounted) timeoutId = setTimeout(fetchWeights, delay);
-            } catch (err) {
-                console.error("Failed to fetch weights", err);
-                if (isMounted) timeoutId = setTimeout(fetchWeights, 3000); // Retry slow on error
-            }
+        if (!isTraining) return;
+
+        const states = new Map(); // seq -> reconstructed values, used as delta bases
+        const onFrame = (frame) => {
+            if (frame.layer !== layer) return;
+            const matrix = applyWeightFrame(states, frame);
+            if (matrix === null) return; // Base frame unknown; the server falls back to full frames
+            socket.emit('ack_weights', { seq: frame.seq });
+            setData(matrix);
         };
 
-        // Start polling only if training is active
-        if (isTraining) {
-            fetchWeights();
-        }
+        socket.on('weights_frame', onFrame);
+        // The server pools big layers down to the canvas size (keeping the strongest weight per block)
+        socket.emit('subscribe_weights', {
+            model_id: modelId,
+            layer,
+            rate: STREAM_RATE,
+            max_rows: CANVAS_HEIGHT,
+            max_cols: CANVAS_WIDTH,
+            reduce: 'absmax'
+        });
 
         return () => {
-            isMounted = false;
-            clearTimeout(timeoutId);
+            socket.emit('unsubscribe_weights');
+            socket.off('weights_frame', onFrame);
         };
-    }, [layer, isTraining]);
+    }, [layer, modelId, isTraining]);
 
     // --- Effect 2: Canvas Rendering ---
     useEffect(() => {
@@ -168,7 +165,7 @@ const HeatmapViewer = ({ appConfig, isTraining }) => {
                 </div>
             </div>
             <div style={{ flex: 1, minHeight: 0, border: '1px solid #334155', background: '#000', borderRadius: '8px', overflow: 'hidden', display: 'flex', alignItems: 'center', justifyContent: 'center' }}>
-                <canvas ref={canvasRef} width={800} height={400} style={{ maxWidth: '100%', maxHeight: '100%', objectFit: 'contain' }} />
+                <canvas ref={canvasRef} width={CANVAS_WIDTH} height={CANVAS_HEIGHT} style={{ maxWidth: '100%', maxHeight: '100%', objectFit: 'contain' }} />
             </div>
             <p style={{ fontSize: '12px', color: '#94a3b8', marginTop: '15px', borderTop: '1px solid #1e293b', paddingTop: '10px' }}>
                 Displaying {data ? `${data.length}x${data[0].length}` : '...'} matrix.
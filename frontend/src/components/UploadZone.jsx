@@ -13,7 +13,7 @@ import config from '../config';
  * 4. Backend processes it (Image Processing Utils) and runs prediction.
  * 5. Returns prediction class, confidence, and the "AI View" (how the network saw the image).
  */
-const UploadZone = () => {
+const UploadZone = ({ modelId }) => {
     const [prediction, setPrediction] = useState(null);
     const [image, setImage] = useState(null);
     const [loading, setLoading] = useState(false);
@@ -28,6 +28,7 @@ const UploadZone = () => {
 
         const formData = new FormData();
         formData.append('image', file);
+        if (modelId) formData.append('model_id', modelId);
 
         try {
             const res = await fetch(`${config.API_URL}/api/upload-image`, {
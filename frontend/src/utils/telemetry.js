@@ -0,0 +1,50 @@
+/**
+ * Decoding helpers for 'training_update' events.
+ *
+ * With `telemetry_format: 'binary'` the backend sends the sample fields as
+ * { shape, dtype, data } frames where `data` is a raw ArrayBuffer (Socket.IO binary attachment).
+ * These helpers turn them back into the shapes the components already use:
+ * a PNG data URL for `sample_input` and a plain number array for `sample_output`.
+ */
+
+const TYPED_ARRAYS = {
+    uint8: Uint8Array,
+    float32: Float32Array,
+};
+
+const isFrame = (value) => value && typeof value === 'object' && value.data !== undefined && value.shape !== undefined;
+
+const frameToArray = (frame) => {
+    const ArrayType = TYPED_ARRAYS[frame.dtype] || Float32Array;
+    const buffer = frame.data instanceof ArrayBuffer ? frame.data : frame.data.buffer;
+    return new ArrayType(buffer);
+};
+
+// Render grayscale uint8 pixels [H, W] into a data URL via an offscreen canvas.
+const pixelsToDataUrl = (frame) => {
+    const [height, width] = frame.shape.slice(-2);
+    const pixels = frameToArray(frame);
+    const canvas = document.createElement('canvas');
+    canvas.width = width;
+    canvas.height = height;
+    const ctx = canvas.getContext('2d');
+    const image = ctx.createImageData(width, height);
+    for (let i = 0; i < pixels.length; i++) {
+        image.data[i * 4] = image.data[i * 4 + 1] = image.data[i * 4 + 2] = pixels[i];
+        image.data[i * 4 + 3] = 255;
+    }
+    ctx.putImageData(image, 0, 0);
+    return canvas.toDataURL();
+};
+
+/**
+ * Normalizes a 'training_update' payload so components never see binary frames.
+ */
+export const decodeTrainingUpdate = (data) => {
+    if (data.format !== 'binary') return data;
+    return {
+        ...data,
+        sample_input: isFrame(data.sample_input) ? pixelsToDataUrl(data.sample_input) : data.sample_input,
+        sample_output: isFrame(data.sample_output) ? Array.from(frameToArray(data.sample_output)) : data.sample_output,
+    };
+};
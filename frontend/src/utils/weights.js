@@ -0,0 +1,89 @@
+/**
+ * Decoder for the binary weight snapshots served by /api/weights?format=u8|f16.
+ *
+ * Layout: 'NNTW' | uint32 LE header length | JSON header | raw layer data.
+ * See backend/utils/weight_codec.py for the exact format.
+ */
+
+const HEADER_OFFSET = 8; // 4 bytes magic + 4 bytes header length
+
+// Reconstructed frames kept as possible delta bases, before the last acknowledged one.
+// The server bases deltas on the last ack it received, which may lag behind by acks in flight.
+const KEPT_FRAMES = 8;
+
+// IEEE 754 half precision -> number (Float16Array is not available in every browser yet)
+const halfToFloat = (h) => {
+    const sign = h & 0x8000 ? -1 : 1;
+    const exponent = (h >> 10) & 0x1f;
+    const fraction = h & 0x03ff;
+    if (exponent === 0) return sign * Math.pow(2, -14) * (fraction / 1024);
+    if (exponent === 0x1f) return fraction ? NaN : sign * Infinity;
+    return sign * Math.pow(2, exponent - 15) * (1 + fraction / 1024);
+};
+
+// Reshape a flat array into rows (2D layers) or keep it flat (1D layers)
+const toRows = (values, shape) => {
+    if (shape.length < 2) return Array.from(values);
+    const [rows, cols] = shape;
+    const out = new Array(rows);
+    for (let i = 0; i < rows; i++) {
+        out[i] = Array.from(values.subarray(i * cols, (i + 1) * cols));
+    }
+    return out;
+};
+
+/**
+ * Decodes a snapshot into the same { layerName: number[][] } shape as the JSON response.
+ */
+export const decodeWeights = (buffer) => {
+    const view = new DataView(buffer);
+    const headerLength = view.getUint32(4, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, HEADER_OFFSET, headerLength)));
+    const dataStart = HEADER_OFFSET + headerLength;
+
+    const weights = {};
+    header.layers.forEach(layer => {
+        const count = layer.shape.reduce((a, b) => a * b, 1);
+        const values = new Float32Array(count);
+        if (layer.dtype === 'uint8') {
+            const raw = new Uint8Array(buffer, dataStart + layer.offset, count);
+            for (let i = 0; i < count; i++) values[i] = raw[i] * layer.scale + layer.zero;
+        } else {
+            // Copy first: the float16 section is not guaranteed to be 2-byte aligned
+            const raw = new Uint16Array(buffer.slice(dataStart + layer.offset, dataStart + layer.offset + layer.nbytes));
+            for (let i = 0; i < count; i++) values[i] = halfToFloat(raw[i]);
+        }
+        weights[layer.name] = toRows(values, layer.shape);
+    });
+    return weights;
+};
+
+/**
+ * Applies a 'weights_frame' pushed by the server (see backend/training/weight_stream.py).
+ *
+ * `states` maps frame seq -> Float32Array of what we reconstructed for that frame; deltas refer to
+ * one of them via base_seq. Every applied frame is acknowledged by the caller, so only frames
+ * within KEPT_FRAMES of the latest one are kept.
+ * Returns the matrix for display, or null if the base frame is unknown.
+ */
+export const applyWeightFrame = (states, frame) => {
+    let values;
+    if (frame.kind === 'full') {
+        const raw = new Uint8Array(frame.data);
+        values = new Float32Array(raw.length);
+        for (let i = 0; i < raw.length; i++) values[i] = raw[i] * frame.scale + frame.zero;
+    } else {
+        const base = states.get(frame.base_seq);
+        if (!base) return null;
+        values = base.slice();
+        const indices = new Int32Array(frame.indices.slice(0));
+        const deltas = new Uint16Array(frame.values.slice(0));
+        for (let i = 0; i < indices.length; i++) values[indices[i]] += halfToFloat(deltas[i]);
+    }
+    states.set(frame.seq, values);
+    // Frames older than the delta base can never be referenced again; after a full frame
+    // (no base), keep a few in case the server has not received our latest acks yet
+    const oldest = frame.base_seq !== undefined ? frame.base_seq : frame.seq - KEPT_FRAMES;
+    for (const seq of states.keys()) if (seq < oldest) states.delete(seq);
+    return toRows(values, frame.shape);
+};